@@ -1,9 +1,554 @@
-from flask import Flask, render_template, request, session, redirect, url_for
-from markupsafe import Markup
+import atexit
+import bisect
+import contextlib
+import contextvars
+import csv
+import functools
+import hashlib
+import heapq
+import hmac
+import io
+import json
+import mmap
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict, deque as ring_buffer
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout,
+                                wait as wait_futures)
+from multiprocessing import shared_memory
+from types import MappingProxyType
+
+from flask import (Flask, Response, g, has_request_context, jsonify, make_response, render_template,
+                   request, send_file, session, redirect, stream_with_context, url_for,
+                   before_render_template, template_rendered)
+from flask.sessions import SecureCookieSessionInterface
+from markupsafe import Markup, escape
+from werkzeug.exceptions import RequestEntityTooLarge
+
+try:
+    import brotli
+except ImportError:  # responses are gzip-only without it
+    brotli = None
+
+try:
+    import numpy as np
+except ImportError:  # bulk BFS falls back to a pure-Python level loop
+    np = None
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # optional: the ASGI entry point (serve.py --asgi) needs asgiref
+    WsgiToAsgi = None
 
 app = Flask(__name__)
 app.secret_key = "replace-with-a-secure-random-key"
 
+
+# ---------------------------
+# Request instrumentation / Prometheus metrics
+# ---------------------------
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (256, 1024, 2048, 4096, 8192, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        row = self.series.get(labels)
+        if row is None:
+            row = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, row in sorted(self.series.items()):
+            base = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), row[:-1]):
+                cumulative += count
+                out.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            out.append(f"{self.name}_sum{{{base}}} {row[-1]:.6f}")
+            out.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return "\n".join(out)
+
+
+class MetricsRegistry:
+    """Process-wide histograms. When disabled every hook returns immediately."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.request_seconds = Histogram("app_request_duration_seconds", "Wall time per request.",
+                                         ("endpoint", "method", "status"), LATENCY_BUCKETS)
+        self.span_seconds = Histogram("app_span_duration_seconds", "Wall time per named request phase.",
+                                      ("endpoint", "span"), LATENCY_BUCKETS)
+        self.response_bytes = Histogram("app_response_size_bytes", "Response body size.",
+                                        ("endpoint",), SIZE_BUCKETS)
+        self.cookie_bytes = Histogram("app_session_cookie_bytes", "Size of the Set-Cookie session header.",
+                                      ("endpoint",), SIZE_BUCKETS)
+        self.encoded_bytes = Histogram("app_response_encoded_bytes",
+                                       "Response body size on the wire, after content encoding.",
+                                       ("endpoint", "encoding"), SIZE_BUCKETS)
+
+    def observe(self, hist, labels, value):
+        with self.lock:
+            hist.observe(labels, value)
+
+    def render(self):
+        with self.lock:
+            parts = [h.render() for h in (self.request_seconds, self.span_seconds, self.response_bytes,
+                                          self.encoded_bytes, self.cookie_bytes)]
+        return "\n".join(parts) + "\n"
+
+
+metrics = MetricsRegistry(enabled=os.environ.get("APP_METRICS", "1") != "0")
+
+
+def _endpoint():
+    return request.endpoint or "unknown"
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        metrics.observe(metrics.span_seconds, (_endpoint(), self.name), time.perf_counter() - self.t0)
+        return False
+
+
+def span(name):
+    """Time a named phase of the current request: ``with span("bfs"): ...``"""
+    if not metrics.enabled or not has_request_context():
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """Decorator form of span() for helpers shared by many routes."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled or not has_request_context():
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@app.before_request
+def _metrics_start():
+    if metrics.enabled:
+        g._metrics_t0 = time.perf_counter()
+
+
+@app.after_request
+def _metrics_response(response):
+    if metrics.enabled:
+        # runs after _compress_response, which records the pre-encoding size
+        size = g.pop("_identity_length", response.content_length)
+        if size is not None:
+            metrics.observe(metrics.response_bytes, (_endpoint(),), size)
+        if response.content_length is not None:
+            metrics.observe(metrics.encoded_bytes,
+                            (_endpoint(), response.content_encoding or "identity"), response.content_length)
+        g._metrics_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def _metrics_finish(exc):
+    t0 = g.pop("_metrics_t0", None)
+    if t0 is None:
+        return
+    status = g.pop("_metrics_status", 500)
+    metrics.observe(metrics.request_seconds, (_endpoint(), request.method, str(status)),
+                    time.perf_counter() - t0)
+
+
+def _render_started(sender, template, context, **extra):
+    if metrics.enabled and has_request_context():
+        g._render_t0 = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    t0 = g.pop("_render_t0", None) if has_request_context() else None
+    if t0 is not None:
+        metrics.observe(metrics.span_seconds, (_endpoint(), "render"), time.perf_counter() - t0)
+
+
+before_render_template.connect(_render_started, app)
+template_rendered.connect(_render_finished, app)
+
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+    """Signed-cookie sessions that also time the re-sign and record cookie size."""
+
+    def save_session(self, app, session, response):
+        if not metrics.enabled:
+            return super().save_session(app, session, response)
+        with _Span("session_save"):
+            super().save_session(app, session, response)
+        name = self.get_cookie_name(app) + "="
+        size = sum(len(c) for c in response.headers.getlist("Set-Cookie") if c.startswith(name))
+        if size:
+            metrics.observe(metrics.cookie_bytes, (_endpoint(),), size)
+
+
+app.session_interface = TimedSessionInterface()
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of the request/phase histograms."""
+    return Response(metrics.render() + sort_cache.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+# ---------------------------
+# Page / static asset caching
+# ---------------------------
+_page_cache = {}     # endpoint -> (html, etag)
+_static_hashes = {}  # filename -> content hash
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+def cached_page(view):
+    """Render a session-independent page once and serve it with an ETag.
+
+    Repeat visits that send If-None-Match get a bodyless 304.
+    """
+    @functools.wraps(view)
+    def wrapper():
+        entry = _page_cache.get(view.__name__)
+        if entry is None:
+            html = view()
+            entry = _page_cache[view.__name__] = (html, hashlib.sha1(html.encode("utf-8")).hexdigest())
+        response = make_response(entry[0])
+        response.set_etag(entry[1])
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    return wrapper
+
+
+def static_fingerprint(filename):
+    digest = _static_hashes.get(filename)
+    if digest is None:
+        with open(os.path.join(app.static_folder, filename), "rb") as f:
+            digest = _static_hashes[filename] = hashlib.sha256(f.read()).hexdigest()[:12]
+    return digest
+
+
+@app.url_defaults
+def _fingerprint_static_urls(endpoint, values):
+    # url_for('static', filename=...) -> /static/<file>?v=<content hash>
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        try:
+            values["v"] = static_fingerprint(values["filename"])
+        except OSError:
+            pass
+
+
+@app.after_request
+def _immutable_static(response):
+    if request.endpoint == "static" and response.status_code in (200, 304):
+        filename = (request.view_args or {}).get("filename")
+        try:
+            fresh = filename and request.args.get("v") == static_fingerprint(filename)
+        except OSError:
+            fresh = False
+        if fresh:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+    return response
+
+
+# ---------------------------
+# Response compression (gzip / brotli)
+# ---------------------------
+# Negotiated from Accept-Encoding for text-like bodies at or above the size
+# threshold. Buffered bodies are compressed in one go (and left alone if that
+# does not shrink them); streamed ones, such as tree exports, go through an
+# incremental compressor flushed per chunk. Static files are skipped: they
+# are small, cached as immutable and need Range support.
+COMPRESS_ENABLED = os.environ.get("APP_COMPRESS", "1") != "0"
+COMPRESS_MIN_SIZE = int(os.environ.get("APP_COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.environ.get("APP_COMPRESS_LEVEL", "6"))
+COMPRESSIBLE_TYPES = ("text/html", "text/plain", "text/css", "text/csv", "text/javascript",
+                      "application/json", "application/javascript", "image/svg+xml")
+
+
+def choose_encoding(accept_encodings):
+    """Best supported coding from a parsed Accept-Encoding header, or None."""
+    candidates = (("br", "gzip") if brotli is not None else ("gzip",))
+    best = max(candidates, key=lambda c: accept_encodings[c])
+    return best if accept_encodings[best] > 0 else None
+
+
+class _Gzip:
+    def __init__(self):
+        self.z = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.z.compress(data) + self.z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.z.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self.c = brotli.Compressor(quality=min(COMPRESS_LEVEL, 11))
+
+    def compress(self, data):
+        return self.c.process(data) + self.c.flush()
+
+    def finish(self):
+        return self.c.finish()
+
+
+def compress_body(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=min(COMPRESS_LEVEL, 11))
+    z = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return z.compress(data) + z.flush()
+
+
+def _compressed_stream(chunks, encoding, labels):
+    compressor = _Brotli() if encoding == "br" else _Gzip()
+    size_in = size_out = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            size_in += len(chunk)
+            out = compressor.compress(chunk)
+            size_out += len(out)
+            if out:
+                yield out
+        out = compressor.finish()
+        size_out += len(out)
+        yield out
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+        if metrics.enabled:
+            metrics.observe(metrics.response_bytes, labels[:1], size_in)
+            metrics.observe(metrics.encoded_bytes, labels, size_out)
+
+
+@app.after_request
+def _compress_response(response):
+    if (not COMPRESS_ENABLED or response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.mimetype not in COMPRESSIBLE_TYPES or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        labels = (_endpoint(), encoding)
+        response.response = _compressed_stream(response.response, encoding, labels)
+        g._identity_length = None  # recorded when the stream finishes
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        packed = compress_body(data, encoding)
+        if len(packed) >= len(data):
+            return response
+        response.set_data(packed)
+        g._identity_length = len(data)
+    response.content_encoding = encoding
+    # the encoded body is a different representation; a weak validator still
+    # matches If-None-Match, so 304s keep working
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# ---------------------------
+# Algorithm-level operation counters
+# ---------------------------
+# Opt-in per context: when no counter dict is installed, count_op() is a single
+# ContextVar lookup. Hot loops fetch the dict once and report a total at the end.
+_op_counts = contextvars.ContextVar("op_counts", default=None)
+
+OP_COUNTERS_ENABLED = os.environ.get("APP_OP_COUNTERS", "0") == "1"
+
+
+def count_op(name, n=1):
+    counts = _op_counts.get()
+    if counts is not None:
+        counts[name] = counts.get(name, 0) + n
+
+
+@contextlib.contextmanager
+def op_counting():
+    """Collect operation counts for everything run inside the block."""
+    counts = {}
+    token = _op_counts.set(counts)
+    try:
+        yield counts
+    finally:
+        _op_counts.reset(token)
+
+
+def format_op_counts(counts):
+    return "; ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+
+
+@app.before_request
+def _op_counts_start():
+    if OP_COUNTERS_ENABLED or request.args.get("opcounts") == "1":
+        g._op_counts_token = _op_counts.set({})
+
+
+@app.after_request
+def _op_counts_report(response):
+    counts = _op_counts.get() if "_op_counts_token" in g else None
+    if counts:
+        summary = format_op_counts(counts)
+        response.headers["X-Op-Counts"] = summary
+        app.logger.info("op counts %s %s: %s", request.method, request.path, summary)
+    return response
+
+
+@app.teardown_request
+def _op_counts_finish(exc):
+    token = g.pop("_op_counts_token", None)
+    if token is not None:
+        _op_counts.reset(token)
+
+
+# ---------------------------
+# Worker pool for CPU-heavy handlers
+# ---------------------------
+WORKER_PROCESSES = int(os.environ.get("APP_WORKERS", "0"))  # 0 runs everything inline
+WORKER_TIMEOUT = float(os.environ.get("APP_WORKER_TIMEOUT", "10"))
+WORKER_MAX_PENDING = int(os.environ.get("APP_WORKER_MAX_PENDING", "32"))
+OFFLOAD_MIN_COST = int(os.environ.get("APP_OFFLOAD_MIN_COST", "1000"))
+
+
+class OffloadError(Exception):
+    """Raised when offloaded work cannot be completed in time."""
+
+
+class PoolBusy(OffloadError):
+    pass
+
+
+class PoolTimeout(OffloadError):
+    pass
+
+
+class WorkerPool:
+    """Lazily started ProcessPoolExecutor with a queue-depth limit and timeouts.
+
+    Work whose estimated cost is below OFFLOAD_MIN_COST (or the caller's own
+    min_cost) runs inline, since pickling it to another process would cost
+    more than it saves. A timed-out task keeps running in its worker and keeps
+    counting towards max_pending until it finishes, which is what provides
+    back-pressure.
+    """
+
+    def __init__(self, processes, timeout, max_pending):
+        self.processes = processes
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()
+        self._pool = None
+
+    def should_offload(self, cost, min_cost=None):
+        return self.processes > 0 and cost >= (OFFLOAD_MIN_COST if min_cost is None else min_cost)
+
+    def _done(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    def _submit(self, fn, args):
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise PoolBusy("Too many requests are being processed; try again shortly.")
+            self.pending += 1
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def run(self, fn, *args, cost=0, min_cost=None):
+        if not self.should_offload(cost, min_cost):
+            return fn(*args)
+        future = self._submit(fn, args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise PoolTimeout("The request took too long to process.")
+
+    def submit(self, fn, *args):
+        """Future for fn(*args) in the pool, for background jobs that wait without a deadline.
+
+        Raises PoolBusy when the queue is full; callers run the work inline then.
+        """
+        return self._submit(fn, args)
+
+    def shutdown(self):
+        with self.lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+worker_pool = WorkerPool(WORKER_PROCESSES, WORKER_TIMEOUT, WORKER_MAX_PENDING)
+
+
+@app.errorhandler(OffloadError)
+def _offload_failed(exc):
+    return Response(str(exc), status=503, mimetype="text/plain")
+
+
 # ---------------------------
 # Binary Tree implementation
 # ---------------------------
@@ -12,86 +557,150 @@ class Node:
         self.value = value
         self.left = None
         self.right = None
+        self.size = 1  # nodes in this subtree, for order-statistic queries
+        self._hash = None  # cached structural hash, see node_hash()
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+def recompute_sizes(root):
+    """Refresh every subtree size bottom-up (iterative postorder) and drop cached hashes."""
+    stack = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if node is None:
+            continue
+        if children_done:
+            node.size = 1 + _size(node.left) + _size(node.right)
+            node._hash = None
+        else:
+            stack.append((node, True))
+            stack.append((node.left, False))
+            stack.append((node.right, False))
 
 class BinaryTree:
     def __init__(self, root_value=None):
         self.root = Node(root_value) if root_value is not None else None
 
+    def _path_to(self, target):
+        """Ancestors of target (by identity) as [(node, side), ...], or None."""
+        path = []  # ancestors of the node being visited, shared by the whole walk
+        stack = [(self.root, 0, None)]
+        while stack:
+            node, depth, side = stack.pop()
+            if node is None:
+                continue
+            del path[depth:]
+            if depth:
+                path[-1] = (path[-1][0], side)
+            if node is target:
+                return path
+            path.append((node, None))
+            stack.append((node.right, depth + 1, "R"))
+            stack.append((node.left, depth + 1, "L"))
+        return None
+
+    @staticmethod
+    def _touch_path(nodes, delta):
+        """Shift subtree sizes by delta and drop cached hashes on the given nodes only."""
+        for node in nodes:
+            node.size += delta
+            node._hash = None
+
     def insert_left(self, parent, value):
-        if parent.left is None:
-            parent.left = Node(value)
-        else:
-            new_node = Node(value)
+        new_node = Node(value)
+        if parent.left is not None:
             new_node.left = parent.left
-            parent.left = new_node
+            new_node.size += parent.left.size
+        parent.left = new_node
+        self._touch_path([n for n, _ in self._path_to(parent)] + [parent], 1)
         return True
 
     def insert_right(self, parent, value):
-        if parent.right is None:
-            parent.right = Node(value)
-        else:
-            new_node = Node(value)
+        new_node = Node(value)
+        if parent.right is not None:
             new_node.right = parent.right
-            parent.right = new_node
+            new_node.size += parent.right.size
+        parent.right = new_node
+        self._touch_path([n for n, _ in self._path_to(parent)] + [parent], 1)
         return True
 
+    # Traversals and folds below use explicit stacks: imported trees can be far
+    # deeper than the interpreter's recursion limit.
     def preorder(self, node, res=""):
         vals = []
-        def _pre(n):
+        stack = [node]
+        while stack:
+            n = stack.pop()
             if n:
                 vals.append(str(n.value))
-                _pre(n.left)
-                _pre(n.right)
-        _pre(node)
+                stack.append(n.right)
+                stack.append(n.left)
         return " ".join(vals).strip()
 
     def inorder(self, node, res=""):
         vals = []
-        def _in(n):
-            if n:
-                _in(n.left)
-                vals.append(str(n.value))
-                _in(n.right)
-        _in(node)
+        stack = []
+        n = node
+        while stack or n:
+            while n:
+                stack.append(n)
+                n = n.left
+            n = stack.pop()
+            vals.append(str(n.value))
+            n = n.right
         return " ".join(vals).strip()
 
     def postorder(self, node, res=""):
+        # reversed (node, right, left) preorder
         vals = []
-        def _post(n):
+        stack = [node]
+        while stack:
+            n = stack.pop()
             if n:
-                _post(n.left)
-                _post(n.right)
                 vals.append(str(n.value))
-        _post(node)
+                stack.append(n.left)
+                stack.append(n.right)
+        vals.reverse()
         return " ".join(vals).strip()
 
     def search(self, node, key):
-        if node is None:
-            return False
-        if str(node.value) == str(key):
-            return True
-        return self.search(node.left, key) or self.search(node.right, key)
-
-    def find_node(self, node, key):
-        if node is None:
-            return None
-        if str(node.value) == str(key):
-            return node
-        left = self.find_node(node.left, key)
-        if left:
-            return left
-        return self.find_node(node.right, key)
+        return self.find_node(node, key, _counter="search.visited") is not None
+
+    def find_node(self, node, key, _counter="find_node.visited"):
+        # iterative preorder: same first match as the recursive version
+        key = str(key)
+        stack = [node]
+        visited = 0
+        found = None
+        while stack:
+            n = stack.pop()
+            if n is None:
+                continue
+            visited += 1
+            if str(n.value) == key:
+                found = n
+                break
+            stack.append(n.right)
+            stack.append(n.left)
+        count_op(_counter, visited)
+        return found
 
     def get_deepest(self):
         queue = [(self.root, None)]
         last, parent = None, None
+        scanned = 0
         while queue:
             node, par = queue.pop(0)
+            scanned += 1
             last, parent = node, par
             if node.left:
                 queue.append((node.left, node))
             if node.right:
                 queue.append((node.right, node))
+        count_op("get_deepest.scanned", scanned)
         return last, parent
 
     def delete(self, key):
@@ -109,74 +718,66 @@ class BinaryTree:
         if node_to_delete == deepest:
             if parent is None:
                 self.root = None
-            elif parent.left == deepest:
-                parent.left = None
-            else:
-                parent.right = None
-            return True
-
-        node_to_delete.value = deepest.value
+                return True
+        else:
+            node_to_delete.value = deepest.value
+            # the copied value changes the structural hash on this path too
+            self._touch_path([n for n, _ in self._path_to(node_to_delete)] + [node_to_delete], 0)
 
+        ancestors = [n for n, _ in self._path_to(deepest)]
         if parent.left == deepest:
             parent.left = None
         else:
             parent.right = None
-
+        self._touch_path(ancestors, -1)
         return True
 
-    def get_max_value(self, node):
-        if node is None:
-            return None
-
-        left_max = self.get_max_value(node.left) if node.left else None
-        right_max = self.get_max_value(node.right) if node.right else None
-
-        # pick the maximum among node.value, left_max, right_max
-        candidates = [c for c in (node.value, left_max, right_max) if c is not None]
-
+    @staticmethod
+    def _extreme(candidates, pick):
+        """pick (max or min) of candidates: numerically if all are numbers, else as strings."""
         def to_number_if_possible(x):
             try:
                 return float(x)
             except Exception:
                 return None
 
-        # if all numeric comparables exist, compare numerically, otherwise fall back to string compare
         nums = [to_number_if_possible(c) for c in candidates]
         if all(n is not None for n in nums) and len(nums) > 0:
-            max_index = nums.index(max(nums))
-            return candidates[max_index]
+            return candidates[nums.index(pick(nums))]
 
         # fallback to string comparison
-        return max(map(str, candidates)) if candidates else None
+        return pick(map(str, candidates)) if candidates else None
 
-    def get_min_value(self, node):
+    def _fold_extreme(self, node, pick):
+        """Per-node pick of (value, left result, right result), bottom-up (iterative postorder)."""
         if node is None:
             return None
+        results = []  # child results, left before right
+        stack = [(node, False)]
+        while stack:
+            n, children_done = stack.pop()
+            if children_done:
+                count = (n.left is not None) + (n.right is not None)
+                children = results[len(results) - count:]
+                del results[len(results) - count:]
+                candidates = [c for c in [n.value] + children if c is not None]
+                results.append(self._extreme(candidates, pick))
+            else:
+                stack.append((n, True))
+                if n.right is not None:
+                    stack.append((n.right, False))
+                if n.left is not None:
+                    stack.append((n.left, False))
+        return results[0]
 
-        left_min = self.get_min_value(node.left) if node.left else None
-        right_min = self.get_min_value(node.right) if node.right else None
-
-        candidates = [c for c in (node.value, left_min, right_min) if c is not None]
-
-        def to_number_if_possible(x):
-            try:
-                return float(x)
-            except Exception:
-                return None
-
-        nums = [to_number_if_possible(c) for c in candidates]
-        if all(n is not None for n in nums) and len(nums) > 0:
-            min_index = nums.index(min(nums))
-            return candidates[min_index]
+    def get_max_value(self, node):
+        return self._fold_extreme(node, max)
 
-        return min(map(str, candidates)) if candidates else None
+    def get_min_value(self, node):
+        return self._fold_extreme(node, min)
 
     def find_height(self, node):
-        if node is None:
-            return -1
-        left_h = self.find_height(node.left)
-        right_h = self.find_height(node.right)
-        return max(left_h, right_h) + 1
+        return tree_stats(node)[1]
 
     def bst_insert(self, value):
         """Insert a value into the tree following BST ordering.
@@ -197,17 +798,23 @@ class BinaryTree:
                 return str(a) < str(b)
 
         cur = self.root
+        comparisons = 0
         while True:
+            comparisons += 1
+            cur.size += 1
+            cur._hash = None
             if less(value, cur.value):
                 if cur.left is None:
                     cur.left = Node(value)
-                    return True
+                    break
                 cur = cur.left
             else:
                 if cur.right is None:
                     cur.right = Node(value)
-                    return True
+                    break
                 cur = cur.right
+        count_op("bst_insert.comparisons", comparisons)
+        return True
 
     def _compare(self, a, b):
         """Return -1 if a<b, 0 if equal, 1 if a>b. Numeric compare preferred."""
@@ -236,70 +843,1168 @@ class BinaryTree:
             cur = cur.left
         return cur
 
+    def _max_node(self, node):
+        cur = node
+        if cur is None:
+            return None
+        while cur.right:
+            cur = cur.right
+        return cur
+
+    def bst_find(self, key):
+        """O(h) lookup that relies on BST ordering (equal keys go right)."""
+        cur = self.root
+        visited = 0
+        while cur is not None:
+            visited += 1
+            if str(cur.value) == str(key):
+                break
+            cur = cur.left if self._compare(key, cur.value) < 0 else cur.right
+        count_op("bst_find.visited", visited)
+        return cur
+
     def bst_delete(self, key):
         """Delete a node by key following BST deletion rules.
 
         Returns True if a node was deleted, False otherwise.
         """
-        def delete_node(node, key):
-            if node is None:
-                return node, False
-
-            cmp = self._compare(key, node.value)
-            if cmp < 0:
-                node.left, deleted = delete_node(node.left, key)
-                return node, deleted
-            elif cmp > 0:
-                node.right, deleted = delete_node(node.right, key)
-                return node, deleted
+        path = []  # ancestors of the node to delete, root first
+        cur = self.root
+        while cur is not None:
+            cmp = self._compare(key, cur.value)
+            if cmp == 0:
+                break
+            path.append(cur)
+            cur = cur.left if cmp < 0 else cur.right
+        count_op("bst_delete.comparisons", len(path) + (cur is not None))
+        if cur is None:
+            return False
+
+        if cur.left is not None and cur.right is not None:
+            # two children: move the inorder successor's value up, then unlink the successor
+            path.append(cur)
+            parent, succ = cur, cur.right
+            while succ.left is not None:
+                path.append(succ)
+                parent, succ = succ, succ.left
+            cur.value = succ.value
+            if parent is cur:
+                parent.right = succ.right
+            else:
+                parent.left = succ.right
+        else:
+            # leaf or one child: the child (or None) takes its place
+            child = cur.left if cur.left is not None else cur.right
+            parent = path[-1] if path else None
+            if parent is None:
+                self.root = child
+            elif parent.left is cur:
+                parent.left = child
+            else:
+                parent.right = child
+        for node in path:
+            node.size -= 1
+            node._hash = None
+        return True
+
+    # Order statistics: O(h) using subtree sizes; assume BST ordering
+    # (left < node <= right under _compare, as bst_insert builds it).
+    def kth_smallest(self, k):
+        """k-th smallest value, 1-based, or None if k is out of range."""
+        cur = self.root
+        if not 1 <= k <= _size(cur):
+            return None
+        visited = 0
+        while cur is not None:
+            visited += 1
+            left = _size(cur.left)
+            if k <= left:
+                cur = cur.left
+            elif k == left + 1:
+                break
             else:
-                # found the node to delete
-                # Case 1: leaf
-                if node.left is None and node.right is None:
-                    return None, True
-                # Case 2: one child
-                if node.left is None:
-                    return node.right, True
-                if node.right is None:
-                    return node.left, True
-                # Case 3: two children -> find inorder successor (min in right subtree)
-                succ = self._min_node(node.right)
-                node.value = succ.value
-                node.right, _ = delete_node(node.right, succ.value)
-                return node, True
-
-        self.root, deleted = delete_node(self.root, key)
-        return deleted
+                k -= left + 1
+                cur = cur.right
+        count_op("kth_smallest.visited", visited)
+        return cur.value if cur is not None else None
+
+    def _count_below(self, key, inclusive):
+        count = 0
+        cur = self.root
+        while cur is not None:
+            cmp = self._compare(cur.value, key)
+            if cmp < 0 or (inclusive and cmp == 0):
+                count += _size(cur.left) + 1
+                cur = cur.right
+            else:
+                cur = cur.left
+        return count
+
+    def rank(self, key):
+        """Number of values strictly less than key."""
+        return self._count_below(key, inclusive=False)
+
+    def count_range(self, lo, hi):
+        """Number of values v with lo <= v <= hi."""
+        if self._compare(lo, hi) > 0:
+            return 0
+        return self._count_below(hi, inclusive=True) - self._count_below(lo, inclusive=False)
+
+    def iter_range(self, lo, hi):
+        """Lazily yield values in [lo, hi] in order, pruning subtrees outside it: O(h + k)."""
+        stack = []
+        cur = self.root
+        while stack or cur is not None:
+            while cur is not None:
+                stack.append(cur)
+                # the left subtree only holds values below cur
+                cur = cur.left if self._compare(cur.value, lo) > 0 else None
+            node = stack.pop()
+            in_lo = self._compare(node.value, lo) >= 0
+            in_hi = self._compare(node.value, hi) <= 0
+            if in_lo and in_hi:
+                yield node.value
+            cur = node.right if in_hi else None
 
 
 # ---------------------------
-# Serialization helpers
+# Persistent (path-copying) Binary Tree
 # ---------------------------
-def serialize(node):
+def _node(value, left=None, right=None):
+    n = Node(value)
+    n.left = left
+    n.right = right
+    n.size = 1 + _size(left) + _size(right)
+    return n
+
+
+class PersistentTree(BinaryTree):
+    """BinaryTree whose mutators never modify an existing node.
+
+    Each mutation copies only the nodes on the root-to-change path and points
+    self.root at the new copy; every untouched subtree is shared. A root taken
+    before a mutation is therefore a complete, unchanged snapshot, which makes
+    each history version cost O(height) nodes.
+    """
+
+    @staticmethod
+    def _copy_path(path, new_child):
+        """path: [(ancestor, "L"|"R"), ...] from the root down. Returns the new root."""
+        for node, side in reversed(path):
+            if side == "L":
+                new_child = _node(node.value, new_child, node.right)
+            else:
+                new_child = _node(node.value, node.left, new_child)
+        return new_child
+
+    def _replace(self, target, new_subtree):
+        self.root = self._copy_path(self._path_to(target), new_subtree)
+
+    def insert_left(self, parent, value):
+        self._replace(parent, _node(parent.value, _node(value, parent.left), parent.right))
+        return True
+
+    def insert_right(self, parent, value):
+        self._replace(parent, _node(parent.value, parent.left, _node(value, None, parent.right)))
+        return True
+
+    def delete(self, key):
+        if self.root is None:
+            return False
+
+        node_to_delete = self.find_node(self.root, key)
+        if node_to_delete is None:
+            return False
+
+        deepest, parent = self.get_deepest()
+        if node_to_delete is deepest:
+            if parent is None:
+                self.root = None
+            else:
+                self._replace(deepest, None)
+            return True
+
+        # drop the deepest leaf, then copy its value into the target; the
+        # target's path is unchanged because the deepest node is a leaf
+        sides = [side for _, side in self._path_to(node_to_delete)]
+        self._replace(deepest, None)
+        path = []
+        cur = self.root
+        for side in sides:
+            path.append((cur, side))
+            cur = cur.left if side == "L" else cur.right
+        self.root = self._copy_path(path, _node(deepest.value, cur.left, cur.right))
+        return True
+
+    def bst_insert(self, value):
+        if value is None or str(value).strip() == "":
+            return False
+
+        path = []
+        cur = self.root
+        while cur is not None:
+            if self._compare(value, cur.value) < 0:
+                path.append((cur, "L"))
+                cur = cur.left
+            else:
+                path.append((cur, "R"))
+                cur = cur.right
+        count_op("bst_insert.comparisons", len(path))
+        self.root = self._copy_path(path, Node(value))
+        return True
+
+    def bst_delete(self, key):
+        path = []
+        cur = self.root
+        while cur is not None:
+            cmp = self._compare(key, cur.value)
+            if cmp == 0:
+                break
+            path.append((cur, "L" if cmp < 0 else "R"))
+            cur = cur.left if cmp < 0 else cur.right
+        if cur is None:
+            return False
+
+        if cur.left is None:
+            replacement = cur.right
+        elif cur.right is None:
+            replacement = cur.left
+        else:
+            # copy the right subtree's path down to its minimum, minus that node
+            succ_path = []
+            succ = cur.right
+            while succ.left is not None:
+                succ_path.append((succ, "L"))
+                succ = succ.left
+            replacement = _node(succ.value, cur.left, self._copy_path(succ_path, succ.right))
+        self.root = self._copy_path(path, replacement)
+        return True
+
+
+# ---------------------------
+# Structural (Merkle) hashing
+# ---------------------------
+# node_hash(n) = H(value, node_hash(left), node_hash(right)), cached on the
+# node. Persistent-tree mutations only create new nodes along the changed
+# path, so re-hashing after an edit costs O(height); equal hashes mean equal
+# subtrees, which drives tree equality, diffs, ETags and the render caches.
+EMPTY_HASH = bytes(16)
+
+
+def _hash_parts(value, left_hash, right_hash):
+    raw = str(value).encode("utf-8")
+    h = hashlib.blake2b(digest_size=16)
+    h.update(len(raw).to_bytes(4, "little"))
+    h.update(raw)
+    h.update(left_hash)
+    h.update(right_hash)
+    return h.digest()
+
+
+def node_hash(node):
     if node is None:
-        return None
-    return {
-        "value": node.value,
-        "left": serialize(node.left),
-        "right": serialize(node.right),
-    }
+        return EMPTY_HASH
+    if node._hash is not None:
+        return node._hash
+    hashed = 0
+    stack = [(node, False)]
+    while stack:
+        n, children_done = stack.pop()
+        if children_done:
+            left = n.left._hash if n.left is not None else EMPTY_HASH
+            right = n.right._hash if n.right is not None else EMPTY_HASH
+            n._hash = _hash_parts(n.value, left, right)
+            hashed += 1
+        elif n._hash is None:
+            stack.append((n, True))
+            for child in (n.left, n.right):
+                if child is not None and child._hash is None:
+                    stack.append((child, False))
+    count_op("node_hash.hashed", hashed)
+    return node._hash
+
+
+def trees_equal(a, b):
+    return node_hash(a) == node_hash(b)
+
+
+def tree_diff(a, b, limit=200):
+    """Positional differences between two trees, skipping identical subtrees.
+
+    Work is proportional to the changed region, not the tree size. Each entry
+    is {"path": "LR..", "op": "changed"|"added"|"removed", ...}.
+    """
+    out = []
+    stack = [(a, b, "")]
+    while stack and len(out) < limit:
+        x, y, path = stack.pop()
+        if node_hash(x) == node_hash(y):
+            continue
+        if x is None:
+            out.append({"path": path, "op": "added", "value": y.value, "size": _size(y)})
+        elif y is None:
+            out.append({"path": path, "op": "removed", "value": x.value, "size": _size(x)})
+        else:
+            if str(x.value) != str(y.value):
+                out.append({"path": path, "op": "changed", "old": x.value, "new": y.value})
+            stack.append((x.right, y.right, path + "R"))
+            stack.append((x.left, y.left, path + "L"))
+    return out
 
-def deserialize(data):
+
+# ---------------------------
+# Serialization helpers
+# ---------------------------
+# Session state is stored in a compact, versioned binary form:
+#
+#   byte 0   codec version (CODEC_VERSION)
+#   byte 1   flags (FLAG_ZLIB: the rest is zlib-compressed)
+#   body     tree:   varint n, 2-bit child-presence bitmap in preorder
+#                    (left, right), then n length-prefixed UTF-8 values
+#            values: varint n, then n length-prefixed UTF-8 values
+#
+# Older cookies hold nested {"value", "left", "right"} dicts or plain lists;
+# deserialize() and the rebuild_* helpers still accept those.
+CODEC_VERSION = 1
+FLAG_ZLIB = 0x01
+COMPRESS_MIN_BYTES = 64
+
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf, pos):
+    shift = result = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_values(out, values):
+    for v in values:
+        raw = str(v).encode("utf-8")
+        _write_varint(out, len(raw))
+        out += raw
+
+
+def _read_values(buf, pos, n):
+    values = []
+    for _ in range(n):
+        length, pos = _read_varint(buf, pos)
+        values.append(bytes(buf[pos:pos + length]).decode("utf-8"))
+        pos += length
+    return values, pos
+
+
+def _frame(body, compress=True):
+    flags = 0
+    if compress and len(body) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(bytes(body), 6)
+        if len(packed) < len(body):
+            body, flags = packed, FLAG_ZLIB
+    return bytes((CODEC_VERSION, flags)) + bytes(body)
+
+
+def _unframe(data):
+    if len(data) < 2 or data[0] != CODEC_VERSION:
+        raise ValueError(f"unsupported state codec version: {data[:1]!r}")
+    body = data[2:]
+    if data[1] & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    return body
+
+
+def serialize(node, compress=True):
+    """Encode a tree as compact bytes (preorder + child bitmap + values)."""
+    order = []
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n is None:
+            continue
+        order.append(n)
+        stack.append(n.right)
+        stack.append(n.left)
+
+    bitmap = bytearray((2 * len(order) + 7) // 8)
+    for i, n in enumerate(order):
+        if n.left is not None:
+            bitmap[(2 * i) >> 3] |= 1 << ((2 * i) & 7)
+        if n.right is not None:
+            bitmap[(2 * i + 1) >> 3] |= 1 << ((2 * i + 1) & 7)
+
+    body = bytearray()
+    _write_varint(body, len(order))
+    body += bitmap
+    _write_values(body, (n.value for n in order))
+    return _frame(body, compress)
+
+
+def _deserialize_nested(data):
+    """Legacy format: nested {"value", "left", "right"} dicts."""
     if data is None:
         return None
     node = Node(data["value"])
-    node.left = deserialize(data["left"])
-    node.right = deserialize(data["right"])
+    node.left = _deserialize_nested(data["left"])
+    node.right = _deserialize_nested(data["right"])
+    node.size = 1 + _size(node.left) + _size(node.right)
     return node
 
-def rebuild_tree():
-    tree = BinaryTree()
-    if "tree_data" in session:
-        tree.root = deserialize(session["tree_data"])
+
+def deserialize(data):
+    if data is None or isinstance(data, dict):
+        return _deserialize_nested(data)
+
+    body = _unframe(data)
+    n, pos = _read_varint(body, 0)
+    if n == 0:
+        return None
+    bits = body[pos:pos + (2 * n + 7) // 8]
+    values, _ = _read_values(body, pos + len(bits), n)
+
+    nodes = [Node(v) for v in values]
+    # rebuild from preorder: a stack of nodes still waiting for a right child
+    pending = []
+    for i in range(1, n):
+        prev = nodes[i - 1]
+        has_left = bits[(2 * (i - 1)) >> 3] >> ((2 * (i - 1)) & 7) & 1
+        has_right = bits[(2 * (i - 1) + 1) >> 3] >> ((2 * (i - 1) + 1) & 7) & 1
+        if has_right:
+            pending.append(prev)
+        if has_left:
+            prev.left = nodes[i]
+        else:
+            pending.pop().right = nodes[i]
+    # children follow their parent in preorder, so one reverse pass sizes everything
+    for node in reversed(nodes):
+        node.size = 1 + _size(node.left) + _size(node.right)
+    return nodes[0]
+
+
+def encode_values(values, compress=True):
+    """Encode a queue/deque snapshot as compact bytes."""
+    values = list(values)
+    body = bytearray()
+    _write_varint(body, len(values))
+    _write_values(body, values)
+    return _frame(body, compress)
+
+
+def decode_values(data):
+    """Inverse of encode_values; legacy plain lists are returned unchanged."""
+    if data is None:
+        return []
+    if isinstance(data, list):
+        return data
+    body = _unframe(data)
+    n, pos = _read_varint(body, 0)
+    values, _ = _read_values(body, pos, n)
+    return values
+
+# ---------------------------
+# Lazy read-only tree view
+# ---------------------------
+# Read-only routes navigate the stored form directly: wrappers are created
+# only for nodes that are actually visited, so an O(h) BST lookup allocates
+# O(h) wrappers instead of a Node per element. The wrappers have no setters;
+# anything that mutates goes through get_tree_history(), which deserializes.
+_UNSET = object()
+
+
+class _NestedNode:
+    """View over the legacy nested-dict form."""
+    __slots__ = ("_data", "_left", "_right", "_size", "_hash")
+
+    def __init__(self, data):
+        self._data = data
+        self._left = self._right = _UNSET
+        self._size = None
+        self._hash = None
+
+    @property
+    def value(self):
+        return self._data["value"]
+
+    @property
+    def left(self):
+        if self._left is _UNSET:
+            child = self._data["left"]
+            self._left = _NestedNode(child) if child is not None else None
+        return self._left
+
+    @property
+    def right(self):
+        if self._right is _UNSET:
+            child = self._data["right"]
+            self._right = _NestedNode(child) if child is not None else None
+        return self._right
+
+    @property
+    def size(self):
+        # legacy data carries no sizes; count this subtree once
+        if self._size is None:
+            count, stack = 0, [self._data]
+            while stack:
+                d = stack.pop()
+                if d is not None:
+                    count += 1
+                    stack.append(d["left"])
+                    stack.append(d["right"])
+            self._size = count
+        return self._size
+
+
+class _FlatTree:
+    """Shared state for views over the compact codec.
+
+    Structure bits and value offsets are plain integer arrays built on first
+    use; values are decoded only for visited nodes.
+    """
+
+    def __init__(self, data):
+        self.body = _unframe(data)
+        self.n, pos = _read_varint(self.body, 0)
+        nbytes = (2 * self.n + 7) // 8
+        self.bits = self.body[pos:pos + nbytes]
+        self.values_start = pos + nbytes
+        self._right = None
+        self._offsets = None
+        self._sizes = None
+
+    def has_left(self, i):
+        return self.bits[(2 * i) >> 3] >> ((2 * i) & 7) & 1
+
+    def has_right(self, i):
+        return self.bits[(2 * i + 1) >> 3] >> ((2 * i + 1) & 7) & 1
+
+    def right_index(self, i):
+        if self._right is None:
+            right = array("i", [-1]) * self.n
+            pending = []
+            for j in range(1, self.n):
+                if self.has_right(j - 1):
+                    pending.append(j - 1)
+                if not self.has_left(j - 1):
+                    right[pending.pop()] = j
+            self._right = right
+        return self._right[i]
+
+    def size(self, i):
+        if self._sizes is None:
+            sizes = array("L", [1]) * self.n
+            for j in range(self.n - 1, -1, -1):
+                if self.has_left(j):
+                    sizes[j] += sizes[j + 1]
+                if self.has_right(j):
+                    sizes[j] += sizes[self.right_index(j)]
+            self._sizes = sizes
+        return self._sizes[i]
+
+    def value(self, i):
+        if self._offsets is None:
+            offsets = array("L", [0]) * self.n
+            pos = self.values_start
+            for j in range(self.n):
+                offsets[j] = pos
+                length, pos = _read_varint(self.body, pos)
+                pos += length
+            self._offsets = offsets
+        length, pos = _read_varint(self.body, self._offsets[i])
+        return bytes(self.body[pos:pos + length]).decode("utf-8")
+
+
+class _FlatNode:
+    __slots__ = ("_tree", "_i", "_value", "_left", "_right", "_hash")
+
+    def __init__(self, tree, i):
+        self._tree = tree
+        self._i = i
+        self._value = self._left = self._right = _UNSET
+        self._hash = None
+
+    @property
+    def value(self):
+        if self._value is _UNSET:
+            self._value = self._tree.value(self._i)
+        return self._value
+
+    @property
+    def left(self):
+        if self._left is _UNSET:
+            self._left = _FlatNode(self._tree, self._i + 1) if self._tree.has_left(self._i) else None
+        return self._left
+
+    @property
+    def right(self):
+        if self._right is _UNSET:
+            self._right = (_FlatNode(self._tree, self._tree.right_index(self._i))
+                           if self._tree.has_right(self._i) else None)
+        return self._right
+
+    @property
+    def size(self):
+        return self._tree.size(self._i)
+
+
+def tree_view(data):
+    """Root of a lazy read-only view over stored tree data (nested or compact)."""
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        return _NestedNode(data)
+    flat = _FlatTree(data)
+    return _FlatNode(flat, 0) if flat.n else None
+
+
+# ---------------------------
+# Named tree workspaces
+# ---------------------------
+# Each workspace is stored under its own session key and only deserialized
+# when a route touches it; "tree_meta" keeps size/height/version per name so
+# listing workspaces never materializes a tree. /tree and /bst each remember
+# their own active workspace, so building a BST no longer clobbers the
+# free-form tree.
+DEFAULT_TREES = {"tree": "default", "bst": "bst"}
+MAX_TREES = 10
+MAX_TREE_NAME = 40
+
+
+def tree_storage_key(name):
+    # the original single-tree key is kept for the default workspace
+    return "tree_data" if name == "default" else f"tree_data:{name}"
+
+
+def tree_page():
+    page = request.values.get("page")
+    if page in DEFAULT_TREES:
+        return page
+    return "bst" if (request.endpoint or "").startswith("bst") else "tree"
+
+
+def active_tree_name(page=None):
+    page = page or tree_page()
+    return session.get("active_trees", {}).get(page, DEFAULT_TREES[page])
+
+
+def set_active_tree(page, name):
+    active = dict(session.get("active_trees", {}))
+    active[page] = name
+    session["active_trees"] = active
+
+
+def tree_meta():
+    return session.get("tree_meta", {})
+
+
+def update_tree_meta(name, **fields):
+    meta = dict(tree_meta())
+    entry = dict(meta.get(name, {}))
+    entry.update(fields)
+    meta[name] = entry
+    session["tree_meta"] = meta
+
+
+def valid_tree_name(name):
+    return 0 < len(name) <= MAX_TREE_NAME and all(ch.isalnum() or ch in " -_" for ch in name)
+
+
+def list_tree_workspaces():
+    """Workspace names with their metadata, without deserializing anything."""
+    meta = tree_meta()
+    names = set(meta) | set(DEFAULT_TREES.values())
+    return [{"name": n, "size": meta.get(n, {}).get("size", 0),
+             "height": meta.get(n, {}).get("height", -1),
+             "version": meta.get(n, {}).get("version", 0)} for n in sorted(names)]
+
+
+app.add_template_global(list_tree_workspaces, "tree_workspaces")
+app.add_template_global(active_tree_name, "active_tree_name")
+
+
+def tree_stats(root):
+    """(size, height) by level-order walk; height of an empty tree is -1."""
+    size, height = 0, -1
+    level = [root] if root is not None else []
+    while level:
+        height += 1
+        size += len(level)
+        level = [c for n in level for c in (n.left, n.right) if c is not None]
+    return size, height
+
+
+# Every workspace's tree shares the one session cookie, so inline trees
+# together may add at most COOKIE_TREE_BUDGET bytes to it once encoded; a tree
+# that would push the total past that is kept server-side and the session only
+# holds {"blob": <id>}. Blobs are files in TREE_BLOB_DIR, so
+# they survive restarts and are shared by every worker process on the host;
+# recently used ones are also held in memory up to TREE_BLOB_CACHE_BYTES.
+# The directory is trimmed to TREE_BLOB_DISK_BYTES (least recently used files
+# first, checked at most once per TREE_BLOB_SWEEP_SECONDS). A session whose
+# blob is gone gets TreeDataMissing, never a silently empty tree.
+COOKIE_TREE_BUDGET = 2400  # leaves room for tree_meta, queues and the signature under 4093
+TREE_BLOB_DIR = os.environ.get("APP_TREE_BLOB_DIR") or os.path.join(app.instance_path, "tree_blobs")
+TREE_BLOB_CACHE_BYTES = int(os.environ.get("APP_TREE_BLOB_CACHE_BYTES", str(16 * 1024 * 1024)))
+TREE_BLOB_DISK_BYTES = int(os.environ.get("APP_TREE_BLOB_DISK_BYTES", str(512 * 1024 * 1024)))
+TREE_BLOB_SWEEP_SECONDS = 60
+
+
+class TreeDataMissing(Exception):
+    """The session refers to a server-side tree blob that no longer exists."""
+
+    def __init__(self, name):
+        super().__init__(f"The stored data for tree '{name}' is no longer available; "
+                         "the workspace has been reset.")
+        self.name = name
+
+
+class TreeBlobStore:
+    """Tree blobs on disk with a byte-bounded in-memory LRU in front."""
+
+    def __init__(self, directory, cache_bytes, disk_bytes):
+        self.directory = directory
+        self.cache_bytes = cache_bytes
+        self.disk_bytes = disk_bytes
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # ref -> bytes
+        self.cached = 0
+        self.next_sweep = 0.0
+
+    def _path(self, ref):
+        return os.path.join(self.directory, f"{ref}.bin")
+
+    def put(self, data):
+        ref = uuid.uuid4().hex
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self._path(ref)}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(ref))
+        self._remember(ref, data)
+        if time.monotonic() >= self.next_sweep:
+            self.sweep()
+        return ref
+
+    def get(self, ref):
+        """Blob bytes, or None if it is gone."""
+        if not isinstance(ref, str) or len(ref) != 32 or not all(c in "0123456789abcdef" for c in ref):
+            return None
+        with self.lock:
+            data = self.cache.get(ref)
+            if data is not None:
+                self.cache.move_to_end(ref)
+        try:
+            if data is None:
+                with open(self._path(ref), "rb") as f:
+                    data = f.read()
+                self._remember(ref, data)
+            os.utime(self._path(ref))  # recency for sweep()
+        except FileNotFoundError:
+            with self.lock:
+                old = self.cache.pop(ref, None)
+                if old is not None:
+                    self.cached -= len(old)
+            return None
+        return data
+
+    def delete(self, ref):
+        with self.lock:
+            data = self.cache.pop(ref, None)
+            if data is not None:
+                self.cached -= len(data)
+        with contextlib.suppress(OSError):
+            os.remove(self._path(ref))
+
+    def _remember(self, ref, data):
+        if len(data) > self.cache_bytes:
+            return
+        with self.lock:
+            if ref in self.cache:
+                self.cache.move_to_end(ref)
+                return
+            self.cache[ref] = data
+            self.cached += len(data)
+            while self.cached > self.cache_bytes:
+                _, old = self.cache.popitem(last=False)
+                self.cached -= len(old)
+
+    def sweep(self):
+        """Delete least recently used blob files until the directory fits in disk_bytes."""
+        self.next_sweep = time.monotonic() + TREE_BLOB_SWEEP_SECONDS
+        files = []
+        with contextlib.suppress(FileNotFoundError), os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".bin"):
+                    with contextlib.suppress(FileNotFoundError):
+                        st = entry.stat()
+                        files.append((st.st_mtime, st.st_size, entry.name[:-len(".bin")]))
+        total = sum(size for _, size, _ in files)
+        for _, size, ref in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            self.delete(ref)
+            total -= size
+
+
+tree_blobs = TreeBlobStore(TREE_BLOB_DIR, TREE_BLOB_CACHE_BYTES, TREE_BLOB_DISK_BYTES)
+
+
+def _blob_ref(stored):
+    return stored.get("blob") if isinstance(stored, dict) else None
+
+
+def _cookie_cost(stored):
+    """Bytes stored adds to the cookie: tagged JSON, then base64 (compression only helps)."""
+    return -(-len(app.session_interface.serializer.dumps(stored)) * 4 // 3)
+
+
+def _inline_tree_cost(skip_key):
+    """Cookie bytes taken by the trees of all other workspaces stored inline."""
+    return sum(_cookie_cost(stored) for key, stored in session.items()
+               if key.startswith("tree_data") and key != skip_key
+               and stored is not None and _blob_ref(stored) is None)
+
+
+def store_tree_data(name, data):
+    key = tree_storage_key(name)
+    old = _blob_ref(session.get(key))
+    if old:
+        tree_blobs.delete(old)
+    if _cookie_cost(data) + _inline_tree_cost(key) <= COOKIE_TREE_BUDGET:
+        session[key] = data
+    else:
+        session[key] = {"blob": tree_blobs.put(data)}
+
+
+def load_tree_data(name):
+    """Stored tree data for a workspace (compact bytes, legacy dict or None).
+
+    Raises TreeDataMissing when the session points at a blob that is gone.
+    """
+    stored = session.get(tree_storage_key(name))
+    ref = _blob_ref(stored)
+    if ref is None:
+        return stored
+    data = tree_blobs.get(ref)
+    if data is None:
+        raise TreeDataMissing(name)
+    return data
+
+
+def drop_tree_data(name):
+    ref = _blob_ref(session.pop(tree_storage_key(name), None))
+    if ref:
+        tree_blobs.delete(ref)
+
+
+@app.errorhandler(TreeDataMissing)
+def _tree_data_missing(exc):
+    # forget the dangling reference and the metadata that described the lost tree
+    session.pop(tree_storage_key(exc.name), None)
+    meta = dict(tree_meta())
+    meta[exc.name] = {"size": 0, "height": -1, "version": 0, "ordered": True}
+    session["tree_meta"] = meta
+    return Response(str(exc), status=410, mimetype="text/plain")
+
+
+def _load_tree_root(name):
+    data = load_tree_data(name)
+    return deserialize(data) if data is not None else None
+
+
+@timed("deserialize")
+def rebuild_tree(name=None, lazy=False):
+    """Active workspace's tree; served from the in-memory history when current.
+
+    With lazy=True a cold load returns a read-only view (see tree_view)
+    instead of deserializing every node.
+    """
+    name = name or active_tree_name()
+    hist = _cached_history(name)
+    if hist is not None:
+        tree = PersistentTree()
+        tree.root = hist.current
+    elif lazy:
+        tree = BinaryTree()
+        tree.root = tree_view(load_tree_data(name))
+    else:
+        tree = PersistentTree()
+        tree.root = _load_tree_root(name)
     return tree
 
-def save_tree(tree):
-    session["tree_data"] = serialize(tree.root)
+
+def is_bst_ordered(name=None):
+    """Whether a workspace has only been changed by BST operations.
+
+    Metadata written before the flag existed says nothing about how the tree
+    was built, so the stored tree is checked once and the answer recorded.
+    """
+    name = name or active_tree_name()
+    ordered = tree_meta().get(name, {}).get("ordered")
+    if ordered is None:
+        ordered = in_bst_order(tree_view(load_tree_data(name)))
+        update_tree_meta(name, ordered=ordered)
+    return ordered
+
+
+def in_bst_order(root):
+    """True when an inorder walk never steps down in BST comparison order."""
+    compare = BinaryTree()._compare
+    stack, node, prev = [], root, _UNSET
+    while stack or node is not None:
+        while node is not None:
+            stack.append(node)
+            node = node.left
+        node = stack.pop()
+        if prev is not _UNSET and compare(prev, node.value) > 0:
+            return False
+        prev = node.value
+        node = node.right
+    return True
+
+@timed("serialize")
+def save_tree(tree, name=None):
+    name = name or active_tree_name()
+    store_tree_data(name, serialize(tree.root))
+    size, height = tree_stats(tree.root)
+    update_tree_meta(name, size=size, height=height, hash=node_hash(tree.root).hex())
+
+
+MAX_RENDER_NODES = 500  # larger trees are listed/drawn only through export
+# SVG cost is counted in nodes, which never reach OFFLOAD_MIN_COST below MAX_RENDER_NODES
+SVG_OFFLOAD_MIN_NODES = int(os.environ.get("APP_SVG_OFFLOAD_MIN_NODES", "200"))
+MAX_DIFF_CHANGES = 200
+
+
+def active_tree_size():
+    return tree_meta().get(active_tree_name(), {}).get("size", 0)
+
+
+def active_tree_hash():
+    """Hex root hash of the active workspace from its metadata, None if unknown.
+
+    Never loads the tree: a conditional GET of a blob-backed tree must not
+    read the blob just to answer 304.
+    """
+    name = active_tree_name()
+    entry = tree_meta().get(name, {})
+    if entry.get("size") == 0 or ("size" not in entry and session.get(tree_storage_key(name)) is None):
+        return EMPTY_HASH.hex()
+    return entry.get("hash")
+
+
+# Rendered traversals/SVG keyed by root hash, shared by every session: a
+# search, an undo back to a seen version or a second workspace holding the
+# same tree is served without walking it again.
+RENDER_CACHE_ENTRIES = 256
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+
+def _render_cache_get(key):
+    with _render_cache_lock:
+        value = _render_cache.get(key)
+        if value is not None:
+            _render_cache.move_to_end(key)
+        return value
+
+
+def _render_cache_put(key, value):
+    with _render_cache_lock:
+        _render_cache[key] = value
+        while len(_render_cache) > RENDER_CACHE_ENTRIES:
+            _render_cache.popitem(last=False)
+
+
+@timed("traversals")
+def get_traversals(tree):
+    size = active_tree_size()
+    if size > MAX_RENDER_NODES:
+        skipped = f"({size} nodes, not listed; use Export)"
+        return {"preorder": skipped, "inorder": skipped, "postorder": skipped}
+    key = ("traversals", active_tree_hash() or node_hash(tree.root).hex())
+    cached = _render_cache_get(key)
+    if cached is not None:
+        return cached
+    traversals = {
+        "preorder": tree.preorder(tree.root) if tree.root else "",
+        "inorder": tree.inorder(tree.root) if tree.root else "",
+        "postorder": tree.postorder(tree.root) if tree.root else "",
+    }
+    _render_cache_put(key, traversals)
+    return traversals
+
+
+# ---------------------------
+# Tree version history (undo / redo)
+# ---------------------------
+HISTORY_LIMIT = 50     # versions kept per session
+MAX_HISTORIES = 512    # sessions tracked per process
+# Versions share untouched subtrees, so each one is charged only the nodes it
+# did not share with the version it was committed on top of.
+HISTORY_NODE_BUDGET = int(os.environ.get("APP_HISTORY_NODES", "200000"))         # per session
+HISTORY_TOTAL_NODES = int(os.environ.get("APP_HISTORY_TOTAL_NODES", "2000000"))  # per process
+
+
+def _new_nodes(root, base):
+    """Nodes of root that are not the very node at the same position in base; O(changed)."""
+    count = 0
+    stack = [(root, base)]
+    while stack:
+        node, old = stack.pop()
+        if node is None or node is old:
+            continue
+        count += 1
+        stack.append((node.left, old.left if old is not None else None))
+        stack.append((node.right, old.right if old is not None else None))
+    return count
+
+
+class TreeHistory:
+    """Bounded ring of persistent tree roots with an undo/redo cursor.
+
+    Bounded by HISTORY_LIMIT versions and by HISTORY_NODE_BUDGET retained
+    nodes; the oldest versions go first, the current one is always kept.
+    """
+
+    def __init__(self, root):
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.versions = ring_buffer([(0, "initial", root)])
+        self.costs = ring_buffer([_size(root)])  # nodes charged to each version
+        self.nodes = self.costs[0]
+        self.pos = 0
+
+    @property
+    def current_id(self):
+        return self.versions[self.pos][0]
+
+    @property
+    def current(self):
+        return self.versions[self.pos][2]
+
+    def commit(self, root, label):
+        with self.lock:
+            # a new edit discards the redo tail
+            while len(self.versions) > self.pos + 1:
+                self.versions.pop()
+                self.nodes -= self.costs.pop()
+            cost = _new_nodes(root, self.current)
+            self.versions.append((self.next_id, label, root))
+            self.costs.append(cost)
+            self.nodes += cost
+            self.next_id += 1
+            while len(self.versions) > 1 and (len(self.versions) > HISTORY_LIMIT
+                                              or self.nodes > HISTORY_NODE_BUDGET):
+                self.versions.popleft()
+                self.nodes -= self.costs.popleft()
+                # the new oldest version now owns everything it shared with the dropped one
+                full = _size(self.versions[0][2])
+                self.nodes += full - self.costs[0]
+                self.costs[0] = full
+            self.pos = len(self.versions) - 1
+
+    def undo(self):
+        with self.lock:
+            if self.pos == 0:
+                return False
+            self.pos -= 1
+            return True
+
+    def redo(self):
+        with self.lock:
+            if self.pos == len(self.versions) - 1:
+                return False
+            self.pos += 1
+            return True
+
+    def jump(self, version_id):
+        with self.lock:
+            for i, (vid, _, _) in enumerate(self.versions):
+                if vid == version_id:
+                    self.pos = i
+                    return True
+            return False
+
+    def root_of(self, version_id):
+        with self.lock:
+            for vid, _, root in self.versions:
+                if vid == version_id:
+                    return root
+            return _UNSET
+
+    def summary(self):
+        with self.lock:
+            return [{"version": vid, "label": label, "current": i == self.pos}
+                    for i, (vid, label, _) in enumerate(self.versions)]
+
+
+_histories = OrderedDict()
+_histories_lock = threading.Lock()
+
+
+def _trim_histories():
+    """Drop least recently used histories past MAX_HISTORIES or HISTORY_TOTAL_NODES."""
+    with _histories_lock:
+        total = sum(hist.nodes for hist in _histories.values())
+        while len(_histories) > 1 and (len(_histories) > MAX_HISTORIES or total > HISTORY_TOTAL_NODES):
+            _, hist = _histories.popitem(last=False)
+            total -= hist.nodes
+
+
+def _cached_history(name):
+    """In-memory history for a workspace if it still matches the cookie, else None."""
+    entry = tree_meta().get(name, {})
+    hid = entry.get("history")
+    with _histories_lock:
+        hist = _histories.get(hid) if hid else None
+        if hist is None or hist.current_id != entry.get("version"):
+            return None
+        _histories.move_to_end(hid)
+        return hist
+
+
+def get_tree_history(name=None):
+    """History for a workspace, reseeded from the cookie tree if lost or stale."""
+    name = name or active_tree_name()
+    hist = _cached_history(name)
+    if hist is None:
+        hist = TreeHistory(_load_tree_root(name))
+        hid = uuid.uuid4().hex
+        with _histories_lock:
+            _histories[hid] = hist
+        _trim_histories()
+        update_tree_meta(name, history=hid, version=hist.current_id)
+    return hist
+
+
+def persistent_tree(hist):
+    tree = PersistentTree()
+    tree.root = hist.current
+    return tree
+
+
+def commit_tree(hist, tree, label, keeps_order=True):
+    """Record a new version. keeps_order=False marks the workspace as no longer BST-ordered."""
+    ordered = tree.root is None or (keeps_order and is_bst_ordered())
+    hist.commit(tree.root, label)
+    _trim_histories()
+    save_tree(tree)
+    update_tree_meta(active_tree_name(), version=hist.current_id, ordered=ordered)
+
+
+def restore_tree(hist):
+    tree = persistent_tree(hist)
+    save_tree(tree)
+    update_tree_meta(active_tree_name(), version=hist.current_id)
+    return tree
 
 
 # ---------------------------
@@ -341,14 +2046,16 @@ class Queue:
             cur = cur.next
         return arr
 
+@timed("deserialize")
 def rebuild_queue():
     q = Queue()
-    for item in session.get("queue_data", []):
+    for item in decode_values(session.get("queue_data")):
         q.enqueue(item)
     return q
 
+@timed("serialize")
 def save_queue(q):
-    session["queue_data"] = q.convert_to_list()
+    session["queue_data"] = encode_values(q.convert_to_list())
 
 
 class Deque:
@@ -407,92 +2114,332 @@ class Deque:
             cur = cur.next
         return arr
 
+@timed("deserialize")
 def rebuild_deque():
     dq = Deque()
-    for i in session.get("deque_data", []):
+    for i in decode_values(session.get("deque_data")):
         dq.add_rear(i)
     return dq
 
+@timed("serialize")
 def save_deque(dq):
-    session["deque_data"] = dq.convert_to_list()
+    session["deque_data"] = encode_values(dq.convert_to_list())
+
+
+class IndexedHeap:
+    """Array-backed binary heap (min by default) with stable handles.
+
+    push returns a handle; update/decrease_key/remove find the entry through
+    a handle -> slot map, so they are O(log n) instead of a linear scan.
+    Equal priorities come out in insertion order.
+    """
+
+    def __init__(self, max_heap=False):
+        self.max_heap = max_heap
+        self.entries = []  # [key, handle, item, priority]; key = (±priority, handle)
+        self.slot = {}     # handle -> index in entries
+        self.next_handle = 1
+
+    @classmethod
+    def heapify(cls, pairs, max_heap=False, handles=None, next_handle=None):
+        """O(n) bottom-up build from (item, priority) pairs."""
+        heap = cls(max_heap)
+        pairs = list(pairs)
+        if handles is None:
+            handles = range(1, len(pairs) + 1)
+        heap.entries = [[heap._key(p, h), h, item, p] for (item, p), h in zip(pairs, handles)]
+        heap.slot = {e[1]: i for i, e in enumerate(heap.entries)}
+        heap.next_handle = next_handle or max(heap.slot, default=0) + 1
+        for i in reversed(range(len(heap.entries) // 2)):
+            heap._sift_down(i)
+        return heap
+
+    def _key(self, priority, handle):
+        return (-priority if self.max_heap else priority, handle)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, handle):
+        return handle in self.slot
+
+    def push(self, item, priority):
+        handle = self.next_handle
+        self.next_handle += 1
+        self.entries.append([self._key(priority, handle), handle, item, priority])
+        self.slot[handle] = len(self.entries) - 1
+        self._sift_up(len(self.entries) - 1)
+        return handle
+
+    def peek(self):
+        """(handle, item, priority) of the top entry, or None."""
+        if not self.entries:
+            return None
+        _, handle, item, priority = self.entries[0]
+        return handle, item, priority
+
+    def pop(self):
+        if not self.entries:
+            return None
+        top = self.peek()
+        self._remove_at(0)
+        return top
+
+    def remove(self, handle):
+        """Remove an entry by handle; returns (handle, item, priority) or None."""
+        i = self.slot.get(handle)
+        if i is None:
+            return None
+        _, handle, item, priority = self.entries[i]
+        self._remove_at(i)
+        return handle, item, priority
+
+    def update(self, handle, priority):
+        """Change an entry's priority in either direction. Returns False for an unknown handle."""
+        i = self.slot.get(handle)
+        if i is None:
+            return False
+        entry = self.entries[i]
+        old = entry[0]
+        entry[0], entry[3] = self._key(priority, handle), priority
+        if entry[0] < old:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+        return True
+
+    def decrease_key(self, handle, priority):
+        """Make an entry more urgent (lower for a min-heap, higher for a max-heap)."""
+        i = self.slot.get(handle)
+        if i is None:
+            return False
+        if self._key(priority, handle) > self.entries[i][0]:
+            raise ValueError("new priority is less urgent than the current one")
+        return self.update(handle, priority)
+
+    def items(self):
+        """(handle, item, priority) in heap array order."""
+        return [(h, item, p) for _, h, item, p in self.entries]
+
+    def ordered(self):
+        """(handle, item, priority) in pop order, without modifying the heap."""
+        return [(h, item, p) for _, h, item, p in sorted(self.entries)]
+
+    def _remove_at(self, i):
+        del self.slot[self.entries[i][1]]
+        last = self.entries.pop()
+        if i < len(self.entries):
+            self.entries[i] = last
+            self.slot[last[1]] = i
+            self._sift_up(i)
+            self._sift_down(self.slot[last[1]])
+
+    def _sift_up(self, i):
+        entries, slot = self.entries, self.slot
+        entry = entries[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if entries[parent][0] <= entry[0]:
+                break
+            entries[i] = entries[parent]
+            slot[entries[i][1]] = i
+            i = parent
+        entries[i] = entry
+        slot[entry[1]] = i
+
+    def _sift_down(self, i):
+        entries, slot = self.entries, self.slot
+        n = len(entries)
+        entry = entries[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and entries[child + 1][0] < entries[child][0]:
+                child += 1
+            if entry[0] <= entries[child][0]:
+                break
+            entries[i] = entries[child]
+            slot[entries[i][1]] = i
+            i = child
+        entries[i] = entry
+        slot[entry[1]] = i
+
+
+def parse_priority(raw):
+    """Float priority from form/JSON input, kept as int when it is whole."""
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"priority must be a number, not {raw!r}")
+    if value != value or value in (float("inf"), float("-inf")):
+        raise ValueError("priority must be a finite number")
+    return int(value) if value.is_integer() else value
+
+
+@timed("deserialize")
+def rebuild_pq():
+    # layout: [mode, next_handle, handle, priority, item, handle, priority, item, ...]
+    state = decode_values(session.get("pq_data"))
+    if not state:
+        return IndexedHeap()
+    rest = state[2:]
+    return IndexedHeap.heapify(
+        [(rest[i + 2], parse_priority(rest[i + 1])) for i in range(0, len(rest), 3)],
+        max_heap=state[0] == "max",
+        handles=[int(rest[i]) for i in range(0, len(rest), 3)],
+        next_handle=int(state[1]))
+
+@timed("serialize")
+def save_pq(heap):
+    state = ["max" if heap.max_heap else "min", heap.next_handle]
+    for handle, item, priority in heap.items():
+        state += [handle, priority, item]
+    session["pq_data"] = encode_values(state)
 
 
 # ---------------------------
 # SVG BINARY TREE RENDERER
 # ---------------------------
+X_SPACING = 110
+Y_SPACING = 90
+# Every node box is a <use> of one shared rect and all styling is in these
+# rules (scoped to .bt), so per-node markup is just two short elements.
+SVG_DEFS = ('<defs><style>.bt path{stroke:#666;stroke-width:2;fill:none}'
+            '.bt .nr{fill:white;stroke:#2c7;stroke-width:1.5;rx:8px}'
+            '.bt text{font-family:Arial;font-size:14px;fill:#222;font-weight:700;'
+            'text-anchor:middle;dominant-baseline:middle}</style>'
+            '<rect id="bt-node" class="nr" x="-32" y="-17" width="64" height="34"/></defs>')
+
+# Subtree fragments keyed by subtree hash. Each fragment is drawn in its own
+# frame (subtree's leftmost slot at x=0, its root at y=40) and placed by its
+# parent with a translate, so an unchanged subtree renders to the same
+# markup wherever it ends up and is reused after an edit elsewhere.
+SVG_FRAGMENT_CACHE_BYTES = 4 * 1024 * 1024
+SVG_FRAGMENT_MAX_BYTES = 64 * 1024
+_svg_fragments = OrderedDict()
+_svg_fragments_bytes = 0
+_svg_fragments_lock = threading.Lock()
+
+
+def _svg_fragment_get(key):
+    with _svg_fragments_lock:
+        entry = _svg_fragments.get(key)
+        if entry is not None:
+            _svg_fragments.move_to_end(key)
+        return entry
+
+
+def _svg_fragment_put(key, entry):
+    global _svg_fragments_bytes
+    if len(entry[0]) > SVG_FRAGMENT_MAX_BYTES:
+        return
+    with _svg_fragments_lock:
+        if key in _svg_fragments:
+            return
+        _svg_fragments[key] = entry
+        _svg_fragments_bytes += len(entry[0])
+        while _svg_fragments_bytes > SVG_FRAGMENT_CACHE_BYTES:
+            _, (markup, _) = _svg_fragments.popitem(last=False)
+            _svg_fragments_bytes -= len(markup)
+
+
+def _svg_subtree(root):
+    """(markup, height) of a subtree in its own frame, built bottom-up."""
+    done = {}
+    drawn = 0
+    stack = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        key = node_hash(node)
+        if key in done:
+            continue
+        if not children_done:
+            entry = _svg_fragment_get(key)
+            if entry is not None:
+                done[key] = entry
+                continue
+            stack.append((node, True))
+            for child in (node.right, node.left):
+                if child is not None:
+                    stack.append((child, False))
+            continue
+
+        left_size = _size(node.left)
+        x = left_size * X_SPACING + 50
+        parts = []
+        height = 0
+        children = []
+        if node.left is not None:
+            children.append((node.left, 0))
+        if node.right is not None:
+            children.append((node.right, (left_size + 1) * X_SPACING))
+        if children:
+            # all edges of this node as one path
+            parts.append('<path d="' + "".join(f"M{x} 60L{dx + _size(child.left) * X_SPACING + 50} 110"
+                                               for child, dx in children) + '"/>')
+        for child, dx in children:
+            markup, child_height = done[node_hash(child)]
+            parts.append(f'<g transform="translate({dx},{Y_SPACING})">{markup}</g>')
+            height = max(height, child_height + 1)
+        parts.append(f'<use href="#bt-node" x="{x}" y="40"/><text x="{x}" y="40">{escape(str(node.value))}</text>')
+        entry = done[key] = ("".join(parts), height)
+        _svg_fragment_put(key, entry)
+        drawn += 1
+    count_op("svg.nodes_drawn", drawn)
+    return done[node_hash(root)]
+
+
+@timed("svg")
 def svg_from_tree(root):
     if root is None:
         return ""
 
-    nodes = []
-    edges = []
-    counter = {"i": 0}
-    positions = {}
-
-    def inorder_assign(node, depth=0):
-        if node is None:
-            return
-        inorder_assign(node.left, depth + 1)
-        x = counter["i"]
-        positions[id(node)] = {"node": node, "x_index": x, "depth": depth}
-        counter["i"] += 1
-        inorder_assign(node.right, depth + 1)
-
-    inorder_assign(root)
-
-    x_spacing = 110
-    y_spacing = 90
+    markup, depth = _svg_subtree(root)
     node_w = 64
     node_h = 34
-
-    for info in positions.values():
-        x = info["x_index"] * x_spacing + 50
-        y = info["depth"] * y_spacing + 40
-        nodes.append({"node": info["node"], "x": x, "y": y})
-
-    node_by_id = {id(n["node"]): n for n in nodes}
-
-    for n in nodes:
-        node = n["node"]
-        if node.left:
-            edges.append((n["x"], n["y"], node_by_id[id(node.left)]["x"], node_by_id[id(node.left)]["y"]))
-        if node.right:
-            edges.append((n["x"], n["y"], node_by_id[id(node.right)]["x"], node_by_id[id(node.right)]["y"]))
-
-    max_x = max(n["x"] for n in nodes) + node_w
-    max_y = max(n["y"] for n in nodes) + node_h + 20
+    max_x = (_size(root) - 1) * X_SPACING + 50 + node_w
+    max_y = depth * Y_SPACING + 40 + node_h + 20
 
     width = max(max_x + 20, 360)
     height = max_y + 20
 
-    svg = [f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">']
-    svg.append('<defs><style>.edge{stroke:#666;stroke-width:2}.node-rect{fill:white;stroke:#2c7;stroke-width:1.5;rx:8;}.node-text{font-family:Arial; font-size:14px; fill:#222; font-weight:700;text-anchor:middle;dominant-baseline:middle;}</style></defs>')
+    return (f'<svg class="bt" width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+            f'xmlns="http://www.w3.org/2000/svg">{SVG_DEFS}{markup}</svg>')
+
 
-    for x1, y1, x2, y2 in edges:
-        svg.append(f'<line class="edge" x1="{x1}" y1="{y1+20}" x2="{x2}" y2="{y2-20}" />')
+def svg_from_data(data):
+    """Worker-side entry: render a tree from its serialized bytes."""
+    return svg_from_tree(deserialize(data))
 
-    for n in nodes:
-        x, y = n["x"], n["y"]
-        v = n["node"].value
-        svg.append(f'''
-        <g>
-            <rect class="node-rect" x="{x-32}" y="{y-17}" width="64" height="34" rx="10"></rect>
-            <text class="node-text" x="{x}" y="{y}">{v}</text>
-        </g>
-        ''')
 
-    svg.append('</svg>')
-    return "".join(svg)
+def render_tree_svg(tree):
+    """svg_from_tree, sent to the worker pool for large trees."""
+    size = active_tree_size()
+    if size > MAX_RENDER_NODES:
+        return f'<p class="muted">This tree has {size} nodes, too many to draw. Use Export to download it.</p>'
+    key = ("svg", active_tree_hash() or node_hash(tree.root).hex())
+    svg = _render_cache_get(key)
+    if svg is None:
+        if worker_pool.should_offload(size, SVG_OFFLOAD_MIN_NODES):
+            svg = worker_pool.run(svg_from_data, serialize(tree.root), cost=size,
+                                  min_cost=SVG_OFFLOAD_MIN_NODES)
+        else:
+            svg = svg_from_tree(tree.root)
+        _render_cache_put(key, svg)
+    return svg
 
 
 # ---------------------------
 # ROUTES (RESTORED ORIGINAL NAMES)
 # ---------------------------
 @app.route("/")
+@cached_page
 def index():
     return render_template("index.html")
 
 @app.route("/works")
+@cached_page
 def works():
     return render_template("workspage.html")
 
@@ -500,7 +2447,7 @@ def works():
 @app.route("/queue", methods=["GET", "POST"])
 def queue():
     if "queue_data" not in session:
-        session["queue_data"] = []
+        session["queue_data"] = encode_values([])
 
     q = rebuild_queue()
     message = ""
@@ -510,12 +2457,14 @@ def queue():
         item = request.form.get("item", "").strip()
 
         if action == "add" and item:
-            q.enqueue(item)
+            with span("queue_op"):
+                q.enqueue(item)
             save_queue(q)
             message = f"Enqueued: {item}"
 
         elif action == "remove":
-            removed = q.dequeue()
+            with span("queue_op"):
+                removed = q.dequeue()
             save_queue(q)
             message = f"Dequeued: {removed}" if removed else "Queue empty!"
 
@@ -526,7 +2475,7 @@ def queue():
 @app.route("/deque", methods=["GET", "POST"])
 def deque():
     if "deque_data" not in session:
-        session["deque_data"] = []
+        session["deque_data"] = encode_values([])
 
     dq = rebuild_deque()
     message = ""
@@ -535,68 +2484,220 @@ def deque():
         action = request.form.get("action")
         item = request.form.get("item", "").strip()
 
-        if action == "add_front" and item:
-            dq.add_front(item)
-            message = f"Added to front: {item}"
+        with span("deque_op"):
+            if action == "add_front" and item:
+                dq.add_front(item)
+                message = f"Added to front: {item}"
 
-        elif action == "add_rear" and item:
-            dq.add_rear(item)
-            message = f"Added to rear: {item}"
+            elif action == "add_rear" and item:
+                dq.add_rear(item)
+                message = f"Added to rear: {item}"
 
-        elif action == "remove_front":
-            removed = dq.remove_front()
-            message = f"Removed front: {removed}"
+            elif action == "remove_front":
+                removed = dq.remove_front()
+                message = f"Removed front: {removed}"
 
-        elif action == "remove_rear":
-            removed = dq.remove_rear()
-            message = f"Removed rear: {removed}"
+            elif action == "remove_rear":
+                removed = dq.remove_rear()
+                message = f"Removed rear: {removed}"
 
         save_deque(dq)
 
     return render_template("deque.html", items=dq.convert_to_list(), message=message)
 
 
+
+MAX_PQ_ITEMS = 500
+
+
+def _pq_handle(fields):
+    try:
+        return int(fields.get("handle"))
+    except (TypeError, ValueError):
+        raise ValueError("handle must be an integer")
+
+
+def parse_pq_bulk(text):
+    """"item:priority" pairs separated by commas or newlines."""
+    pairs = []
+    for part in text.replace("\n", ",").split(","):
+        if part.strip():
+            item, sep, priority = part.rpartition(":")
+            if not sep or not item.strip():
+                raise ValueError(f"'{part.strip()}' is not item:priority")
+            pairs.append((item.strip(), parse_priority(priority)))
+    return pairs
+
+
+def apply_pq_action(heap, action, fields):
+    """Run one page/API action; returns (heap, message). Bad input raises ValueError."""
+    if action == "push":
+        item = str(fields.get("item", "")).strip()
+        if not item:
+            raise ValueError("item is required")
+        if len(heap) >= MAX_PQ_ITEMS:
+            raise ValueError(f"the queue is limited to {MAX_PQ_ITEMS} items")
+        priority = parse_priority(fields.get("priority", 0))
+        with span("pq_op"):
+            handle = heap.push(item, priority)
+        return heap, f"Pushed '{item}' with priority {priority} (handle #{handle})"
+    if action == "pop":
+        with span("pq_op"):
+            top = heap.pop()
+        return heap, f"Popped '{top[1]}' (priority {top[2]})" if top else "Priority queue empty!"
+    if action in ("update", "decrease_key"):
+        handle = _pq_handle(fields)
+        priority = parse_priority(fields.get("priority", 0))
+        with span("pq_op"):
+            ok = heap.update(handle, priority) if action == "update" else heap.decrease_key(handle, priority)
+        return heap, f"Handle #{handle} now has priority {priority}" if ok else f"No item with handle #{handle}"
+    if action == "remove":
+        handle = _pq_handle(fields)
+        with span("pq_op"):
+            removed = heap.remove(handle)
+        return heap, f"Removed '{removed[1]}' (handle #{handle})" if removed else f"No item with handle #{handle}"
+    if action == "bulk":
+        pairs = parse_pq_bulk(str(fields.get("items", "")))
+        if len(heap) + len(pairs) > MAX_PQ_ITEMS:
+            raise ValueError(f"the queue is limited to {MAX_PQ_ITEMS} items")
+        entries = heap.items()
+        first = heap.next_handle
+        with span("pq_op"):
+            heap = IndexedHeap.heapify(
+                [(item, p) for _, item, p in entries] + pairs, heap.max_heap,
+                [h for h, _, _ in entries] + list(range(first, first + len(pairs))), first + len(pairs))
+        return heap, f"Heapified {len(pairs)} new item{'s' if len(pairs) != 1 else ''} into {len(heap)}"
+    if action == "mode":
+        max_heap = fields.get("mode") == "max"
+        entries = heap.items()
+        heap = IndexedHeap.heapify([(item, p) for _, item, p in entries], max_heap,
+                                   [h for h, _, _ in entries], heap.next_handle)
+        return heap, f"Switched to a {'max' if max_heap else 'min'}-heap"
+    if action == "clear":
+        return IndexedHeap(heap.max_heap), "Cleared"
+    raise ValueError(f"unknown action '{action}'")
+
+
+def pq_state(heap):
+    top = heap.peek()
+    return {"mode": "max" if heap.max_heap else "min", "size": len(heap),
+            "top": {"handle": top[0], "item": top[1], "priority": top[2]} if top else None,
+            "items": [{"handle": h, "item": item, "priority": p} for h, item, p in heap.ordered()]}
+
+
+@app.route("/pq", methods=["GET", "POST"])
+def priority_queue():
+    heap = rebuild_pq()
+    message = ""
+
+    if request.method == "POST":
+        try:
+            heap, message = apply_pq_action(heap, request.form.get("action"), request.form)
+        except ValueError as e:
+            message = f"Error: {e}"
+        else:
+            save_pq(heap)
+
+    return render_template("pq.html", heap=heap, items=heap.ordered(), slots=heap.items(),
+                           top=heap.peek(), message=message)
+
+
+@app.route("/api/pq", methods=["GET", "POST"])
+def api_pq():
+    """JSON priority queue on the session: POST {"action": "push", "item": "a", "priority": 3}."""
+    heap = rebuild_pq()
+    message = ""
+    if request.method == "POST":
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return {"error": "expected a JSON object with an action"}, 400
+        try:
+            heap, message = apply_pq_action(heap, data.get("action"), data)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        save_pq(heap)
+    return {"message": message, **pq_state(heap)}
+
+
+def _template_digest():
+    """Digest of this module, templates and static files, so a deploy invalidates tree page ETags."""
+    global _asset_digest
+    if _asset_digest is None:
+        h = hashlib.sha1()
+        with open(os.path.abspath(__file__), "rb") as f:
+            h.update(f.read())
+        for folder in (os.path.join(app.root_path, app.template_folder), app.static_folder):
+            for dirpath, dirnames, filenames in sorted(os.walk(folder)):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    with open(os.path.join(dirpath, filename), "rb") as f:
+                        h.update(f.read())
+        _asset_digest = h.hexdigest()
+    return _asset_digest
+
+
+_asset_digest = None
+
+
+def tree_page_etag():
+    """Validator for GET /tree and /bst built from metadata only, or None if the root hash is unknown."""
+    root_hash = active_tree_hash()
+    if root_hash is None:
+        return None
+    parts = [tree_page(), active_tree_name(), root_hash, _template_digest()]
+    parts += [f"{ws['name']}:{ws['size']}" for ws in list_tree_workspaces()]
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def tree_page_response(template):
+    """Render a tree page, or answer 304 before loading the tree when the ETag matches."""
+    etag = tree_page_etag()
+    if etag and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        tree = rebuild_tree(lazy=True)
+        traversals = get_traversals(tree)
+        svg = render_tree_svg(tree)
+        response = make_response(render_template(template, traversals=traversals, svg_html=Markup(svg), message=""))
+    if etag:
+        response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
 # ORIGINAL TREE ROUTE NAME RESTORED
 @app.route("/tree", methods=["GET"])
 def tree():
-    tree = rebuild_tree()
-    traversals = {
-        "preorder": tree.preorder(tree.root) if tree.root else "",
-        "inorder": tree.inorder(tree.root) if tree.root else "",
-        "postorder": tree.postorder(tree.root) if tree.root else "",
-    }
-    svg = svg_from_tree(tree.root)
-    return render_template("tree.html", traversals=traversals, svg_html=Markup(svg), message="")
+    return tree_page_response("tree.html")
 
 @app.route("/tree/insert", methods=["POST"])
 def tree_insert():
-    tree = rebuild_tree()
+    hist = get_tree_history()
+    tree = persistent_tree(hist)
     parent_val = request.form.get("parent", "").strip()
     value = request.form.get("value", "").strip()
     side = request.form.get("side", "left")
 
     if tree.root is None:
         tree.root = Node(parent_val)
-        save_tree(tree)
+        commit_tree(hist, tree, f"root {parent_val}", keeps_order=False)
 
-    parent = tree.find_node(tree.root, parent_val)
+    with span("tree_op"):
+        parent = tree.find_node(tree.root, parent_val)
     if not parent:
-        svg = svg_from_tree(tree.root)
+        svg = render_tree_svg(tree)
         return render_template("tree.html", traversals={}, svg_html=Markup(svg), message=f"Parent '{parent_val}' not found.")
 
-    if side == "left":
-        tree.insert_left(parent, value)
-    else:
-        tree.insert_right(parent, value)
+    with span("tree_op"):
+        if side == "left":
+            tree.insert_left(parent, value)
+        else:
+            tree.insert_right(parent, value)
 
-    save_tree(tree)
+    commit_tree(hist, tree, f"insert {value} {side} of {parent_val}", keeps_order=False)
 
-    traversals = {
-        "preorder": tree.preorder(tree.root),
-        "inorder": tree.inorder(tree.root),
-        "postorder": tree.postorder(tree.root),
-    }
-    svg = svg_from_tree(tree.root)
+    traversals = get_traversals(tree)
+    svg = render_tree_svg(tree)
 
     return render_template("tree.html", traversals=traversals, svg_html=Markup(svg),
                            message=f"Inserted '{value}' at {side} of '{parent_val}'")
@@ -604,177 +2705,647 @@ def tree_insert():
 
 @app.route("/tree/search", methods=["POST"])
 def tree_search():
-    tree = rebuild_tree()
+    tree = rebuild_tree(lazy=True)
     key = request.form.get("search_key", "").strip()
-    found = tree.search(tree.root, key)
+    with span("tree_op"):
+        found = tree.search(tree.root, key)
 
     message = f"'{key}' found!" if found else f"'{key}' NOT found."
 
-    traversals = {
-        "preorder": tree.preorder(tree.root),
-        "inorder": tree.inorder(tree.root),
-        "postorder": tree.postorder(tree.root),
-    }
+    traversals = get_traversals(tree)
 
-    svg = svg_from_tree(tree.root)
+    svg = render_tree_svg(tree)
     return render_template("tree.html", traversals=traversals, svg_html=Markup(svg), message=message)
 
 
 @app.route("/tree/delete", methods=["POST"])
 def tree_delete():
-    tree = rebuild_tree()
+    hist = get_tree_history()
+    tree = persistent_tree(hist)
     key = request.form.get("delete_key", "").strip()
-    ok = tree.delete(key)
+    with span("tree_op"):
+        ok = tree.delete(key)
 
     message = f"Deleted '{key}'." if ok else f"'{key}' not found."
 
-    save_tree(tree)
+    if ok:
+        commit_tree(hist, tree, f"delete {key}", keeps_order=False)
 
-    traversals = {
-        "preorder": tree.preorder(tree.root),
-        "inorder": tree.inorder(tree.root),
-        "postorder": tree.postorder(tree.root),
-    }
+    traversals = get_traversals(tree)
 
-    svg = svg_from_tree(tree.root)
+    svg = render_tree_svg(tree)
     return render_template("tree.html", traversals=traversals, svg_html=Markup(svg), message=message)
 
 
 @app.route("/bst", methods=["GET"])
 def bst():
-    tree = rebuild_tree()
-    traversals = {
-        "preorder": tree.preorder(tree.root) if tree.root else "",
-        "inorder": tree.inorder(tree.root) if tree.root else "",
-        "postorder": tree.postorder(tree.root) if tree.root else "",
-    }
-    svg = svg_from_tree(tree.root)
-    return render_template("bst.html", traversals=traversals, svg_html=Markup(svg), message="")
+    return tree_page_response("bst.html")
 
 
 @app.route("/bst/search", methods=["POST"])
 def bst_search():
-    tree = rebuild_tree()
+    tree = rebuild_tree(lazy=True)
     key = request.form.get("search_key", "").strip()
-    found = tree.search(tree.root, key)
+    with span("tree_op"):
+        if is_bst_ordered():
+            found = tree.bst_find(key) is not None
+        else:
+            found = tree.search(tree.root, key)
     message = f"'{key}' found!" if found else f"'{key}' NOT found."
-    traversals = {
-        "preorder": tree.preorder(tree.root),
-        "inorder": tree.inorder(tree.root),
-        "postorder": tree.postorder(tree.root),
-    }
-    svg = svg_from_tree(tree.root)
+    traversals = get_traversals(tree)
+    svg = render_tree_svg(tree)
     return render_template("bst.html", traversals=traversals, svg_html=Markup(svg), message=message)
 
 
 @app.route("/bst/delete", methods=["POST"])
 def bst_delete():
-    tree = rebuild_tree()
+    hist = get_tree_history()
+    tree = persistent_tree(hist)
     key = request.form.get("delete_key", "").strip()
-    ok = tree.bst_delete(key)
+    with span("tree_op"):
+        ok = tree.bst_delete(key)
     message = f"Deleted '{key}'." if ok else f"'{key}' not found."
     if ok:
-        save_tree(tree)
-    traversals = {
-        "preorder": tree.preorder(tree.root),
-        "inorder": tree.inorder(tree.root),
-        "postorder": tree.postorder(tree.root),
-    }
-    svg = svg_from_tree(tree.root)
+        commit_tree(hist, tree, f"delete {key}")
+    traversals = get_traversals(tree)
+    svg = render_tree_svg(tree)
     return render_template("bst.html", traversals=traversals, svg_html=Markup(svg), message=message)
 
 
 @app.route("/bst/max", methods=["POST"])
 def bst_max():
-    tree = rebuild_tree()
+    tree = rebuild_tree(lazy=True)
     if tree.root is None:
         message = "Tree is empty."
     else:
-        m = tree.get_max_value(tree.root)
-        message = f"Max value: {m}" if m is not None else "No values found."
-
-    traversals = {
-        "preorder": tree.preorder(tree.root) if tree.root else "",
-        "inorder": tree.inorder(tree.root) if tree.root else "",
-        "postorder": tree.postorder(tree.root) if tree.root else "",
-    }
-    svg = svg_from_tree(tree.root)
+        with span("tree_op"):
+            if is_bst_ordered():
+                m = tree._max_node(tree.root).value
+            else:
+                m = tree.get_max_value(tree.root)
+        message = f"Max value: {m}" if m is not None else "No values found."
+
+    traversals = get_traversals(tree)
+    svg = render_tree_svg(tree)
     return render_template("bst.html", traversals=traversals, svg_html=Markup(svg), message=message)
 
 
 @app.route("/bst/min", methods=["POST"])
 def bst_min():
-    tree = rebuild_tree()
+    tree = rebuild_tree(lazy=True)
     if tree.root is None:
         message = "Tree is empty."
     else:
-        m = tree.get_min_value(tree.root)
+        with span("tree_op"):
+            if is_bst_ordered():
+                m = tree._min_node(tree.root).value
+            else:
+                m = tree.get_min_value(tree.root)
         message = f"Min value: {m}" if m is not None else "No values found."
 
-    traversals = {
-        "preorder": tree.preorder(tree.root) if tree.root else "",
-        "inorder": tree.inorder(tree.root) if tree.root else "",
-        "postorder": tree.postorder(tree.root) if tree.root else "",
-    }
-    svg = svg_from_tree(tree.root)
+    traversals = get_traversals(tree)
+    svg = render_tree_svg(tree)
     return render_template("bst.html", traversals=traversals, svg_html=Markup(svg), message=message)
 
 
 @app.route("/bst/height", methods=["POST"])
 def bst_height():
-    tree = rebuild_tree()
+    tree = rebuild_tree(lazy=True)
     key = request.form.get("height_key", "").strip()
-    node = tree.find_node(tree.root, key)
+    with span("tree_op"):
+        node = tree.bst_find(key) if is_bst_ordered() else tree.find_node(tree.root, key)
     if node is None:
         message = f"Node '{key}' not found."
     else:
-        h = tree.find_height(node)
+        with span("tree_op"):
+            h = tree.find_height(node)
         message = f"Height of node '{key}': {h}"
 
-    traversals = {
-        "preorder": tree.preorder(tree.root) if tree.root else "",
-        "inorder": tree.inorder(tree.root) if tree.root else "",
-        "postorder": tree.postorder(tree.root) if tree.root else "",
-    }
-    svg = svg_from_tree(tree.root)
+    traversals = get_traversals(tree)
+    svg = render_tree_svg(tree)
     return render_template("bst.html", traversals=traversals, svg_html=Markup(svg), message=message)
 
 
 @app.route("/bst/insert", methods=["POST"])
 def bst_insert():
-    tree = rebuild_tree()
+    hist = get_tree_history()
+    tree = persistent_tree(hist)
     value = request.form.get("value", "").strip()
     if value == "":
         message = "No value provided."
     else:
         # If there's no root, create it; otherwise, perform BST insert
-        if tree.root is None:
-            tree.root = Node(value)
-        else:
-            tree.bst_insert(value)
-        save_tree(tree)
+        with span("tree_op"):
+            if tree.root is None:
+                tree.root = Node(value)
+            else:
+                tree.bst_insert(value)
+        commit_tree(hist, tree, f"insert {value}")
         message = f"Inserted '{value}' into BST."
 
-    traversals = {
-        "preorder": tree.preorder(tree.root) if tree.root else "",
-        "inorder": tree.inorder(tree.root) if tree.root else "",
-        "postorder": tree.postorder(tree.root) if tree.root else "",
-    }
-    svg = svg_from_tree(tree.root)
+    traversals = get_traversals(tree)
+    svg = render_tree_svg(tree)
+    return render_template("bst.html", traversals=traversals, svg_html=Markup(svg), message=message)
+
+
+MAX_RANGE_LISTED = 100
+
+
+def _bst_page(tree, message):
+    traversals = get_traversals(tree)
+    svg = render_tree_svg(tree)
     return render_template("bst.html", traversals=traversals, svg_html=Markup(svg), message=message)
 
 
+@app.route("/bst/kth", methods=["POST"])
+def bst_kth():
+    tree = rebuild_tree(lazy=True)
+    raw = request.form.get("k", "").strip()
+    if not is_bst_ordered():
+        message = "Order statistics need a BST-ordered workspace."
+    elif raw.lower() == "median":
+        n = _size(tree.root)
+        message = f"Median: {tree.kth_smallest((n + 1) // 2)}" if n else "Tree is empty."
+    else:
+        try:
+            k = int(raw)
+        except ValueError:
+            message = "k must be a whole number (or 'median')."
+        else:
+            with span("tree_op"):
+                v = tree.kth_smallest(k)
+            message = f"#{k} smallest value: {v}" if v is not None else f"k must be between 1 and {_size(tree.root)}."
+    return _bst_page(tree, message)
+
+
+@app.route("/bst/rank", methods=["POST"])
+def bst_rank():
+    tree = rebuild_tree(lazy=True)
+    key = request.form.get("rank_key", "").strip()
+    if not is_bst_ordered():
+        message = "Order statistics need a BST-ordered workspace."
+    else:
+        with span("tree_op"):
+            r = tree.rank(key)
+        message = f"{r} value{'s' if r != 1 else ''} smaller than '{key}'."
+    return _bst_page(tree, message)
+
+
+@app.route("/bst/range", methods=["POST"])
+def bst_range():
+    tree = rebuild_tree(lazy=True)
+    lo = request.form.get("lo", "").strip()
+    hi = request.form.get("hi", "").strip()
+    if not is_bst_ordered():
+        message = "Range queries need a BST-ordered workspace."
+    elif not lo or not hi:
+        message = "Enter both ends of the range."
+    else:
+        with span("tree_op"):
+            count = tree.count_range(lo, hi)
+            listed = []
+            for v in tree.iter_range(lo, hi):
+                if len(listed) == MAX_RANGE_LISTED:
+                    break
+                listed.append(str(v))
+        more = " ..." if count > len(listed) else ""
+        message = f"{count} value{'s' if count != 1 else ''} in [{lo}, {hi}]: {' '.join(listed)}{more}"
+    return _bst_page(tree, message)
+
+
+# ---------------------------
+# Tree history routes (shared by /tree and /bst)
+# ---------------------------
+def _back_to_tree_page():
+    page = request.form.get("page", "tree")
+    return redirect(url_for("bst" if page == "bst" else "tree"))
+
+
+@app.route("/tree/undo", methods=["POST"])
+def tree_undo():
+    hist = get_tree_history()
+    if hist.undo():
+        restore_tree(hist)
+    return _back_to_tree_page()
+
+
+@app.route("/tree/redo", methods=["POST"])
+def tree_redo():
+    hist = get_tree_history()
+    if hist.redo():
+        restore_tree(hist)
+    return _back_to_tree_page()
+
+
+@app.route("/tree/history", methods=["GET"])
+def tree_history():
+    hist = get_tree_history()
+    return jsonify({"current": hist.current_id, "versions": hist.summary()})
+
+
+@app.route("/tree/diff", methods=["GET"])
+def tree_diff_route():
+    """Changes between two history versions (default: previous -> current)."""
+    hist = get_tree_history()
+    to_id = request.args.get("to", hist.current_id, type=int)
+    from_id = request.args.get("from", to_id - 1, type=int)
+    old, new = hist.root_of(from_id), hist.root_of(to_id)
+    if old is _UNSET or new is _UNSET:
+        return jsonify({"error": "unknown version"}), 404
+    with span("tree_diff"):
+        changes = tree_diff(old, new, limit=MAX_DIFF_CHANGES + 1)
+    for change in changes:
+        for field in ("value", "old", "new"):
+            if field in change:
+                change[field] = str(change[field])
+    return jsonify({"from": from_id, "to": to_id, "equal": not changes,
+                    "changes": changes[:MAX_DIFF_CHANGES],
+                    "truncated": len(changes) > MAX_DIFF_CHANGES})
+
+
+@app.route("/tree/history/<int:version_id>", methods=["POST"])
+def tree_jump(version_id):
+    hist = get_tree_history()
+    if hist.jump(version_id):
+        restore_tree(hist)
+    return _back_to_tree_page()
+
+
+# ---------------------------
+# Bulk import / export (level order, edge list, values)
+# ---------------------------
+# Formats, all UTF-8 text:
+#   level   level-order values with null markers, JSON-array style or one per
+#           line: ["1", "2", null, "3"]
+#   edges   the root value alone on the first line, then one
+#           "parent<TAB>child<TAB>L|R" line per edge, parents before children
+#   values  one value per line, filled into a complete tree in level order
+# Parsing and writing are iterative and stream the input/output; the only
+# working memory besides the tree is the BFS frontier (and, for edges, the
+# value -> node index needed to resolve parents).
+TREE_FORMATS = ("level", "edges", "values")
+NULL_TOKENS = ("null", "None", "#")
+EXPORT_CHUNK = 1000
+
+
+class TreeImportError(ValueError):
+    pass
+
+
+def _text_lines(stream):
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+
+_LEVEL_SEPARATORS = re.compile(r'[\s,\[\]]*')
+_LEVEL_BARE_TOKEN = re.compile(r'[^,\[\]\r\n]*')
+
+
+def iter_level_tokens(lines):
+    """Level-order tokens, line by line: a JSON array or plain comma-separated values.
+
+    A quoted token is a JSON string and always a value, so export_tree's
+    output reads back unchanged; only an unquoted NULL_TOKENS entry marks a
+    missing child.
+    """
+    for lineno, line in enumerate(lines, 1):
+        pos = _LEVEL_SEPARATORS.match(line).end()
+        while pos < len(line):
+            if line[pos] == '"':
+                try:
+                    tok, pos = json.decoder.scanstring(line, pos + 1)
+                except ValueError as exc:
+                    raise TreeImportError(f"line {lineno}: bad quoted value ({exc.msg})")
+                yield tok
+            else:
+                end = _LEVEL_BARE_TOKEN.match(line, pos).end()
+                tok = line[pos:end].strip()
+                pos = end
+                yield None if tok in NULL_TOKENS else tok
+            pos = _LEVEL_SEPARATORS.match(line, pos).end()
+
+
+def iter_value_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def build_level_order(tokens):
+    """Tree from level-order tokens (None = missing child). Returns the root."""
+    tokens = iter(tokens)
+    first = next(tokens, None)
+    if first is None:
+        return None
+    root = Node(first)
+    frontier = ring_buffer([root])
+    while frontier:
+        parent = frontier.popleft()
+        for side in ("left", "right"):
+            tok = next(tokens, _UNSET)
+            if tok is _UNSET:
+                return root
+            if tok is not None:
+                child = Node(tok)
+                setattr(parent, side, child)
+                frontier.append(child)
+    return root
+
+
+def build_from_edges(lines):
+    root = None
+    index = {}
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        parts = [p.strip() for p in (line.split("\t") if "\t" in line else line.split(","))]
+        if len(parts) == 1 and root is None:
+            root = index[parts[0]] = Node(parts[0])
+            continue
+        if len(parts) != 3 or parts[2].upper() not in ("L", "R", "LEFT", "RIGHT"):
+            raise TreeImportError(f"line {lineno}: expected 'parent<TAB>child<TAB>L|R'")
+        parent_val, child_val, side = parts
+        if root is None:
+            root = index[parent_val] = Node(parent_val)
+        parent = index.get(parent_val)
+        if parent is None:
+            raise TreeImportError(f"line {lineno}: parent '{parent_val}' has not been defined yet")
+        attr = "left" if side.upper().startswith("L") else "right"
+        if getattr(parent, attr) is not None:
+            raise TreeImportError(f"line {lineno}: '{parent_val}' already has a {attr} child")
+        child = index[child_val] = Node(child_val)
+        setattr(parent, attr, child)
+    return root
+
+
+def import_tree(stream, fmt):
+    lines = _text_lines(stream)
+    if fmt == "level":
+        root = build_level_order(iter_level_tokens(lines))
+    elif fmt == "edges":
+        root = build_from_edges(lines)
+    elif fmt == "values":
+        root = build_level_order(iter_value_lines(lines))
+    else:
+        raise TreeImportError(f"unknown format '{fmt}'")
+    recompute_sizes(root)
+    return root
+
+
+def _level_order(root):
+    """(node, parent, side) in level order, without recursion."""
+    frontier = ring_buffer([(root, None, None)] if root is not None else [])
+    while frontier:
+        item = frontier.popleft()
+        yield item
+        node = item[0]
+        if node.left is not None:
+            frontier.append((node.left, node, "L"))
+        if node.right is not None:
+            frontier.append((node.right, node, "R"))
+
+
+def export_tree(root, fmt):
+    """Yield the tree as text chunks in the given format."""
+    buf = []
+    if fmt == "level":
+        buf.append("[")
+        first = True
+        nulls = 0  # held back so trailing nulls are never written
+        frontier = ring_buffer([root] if root is not None else [])
+        while frontier:
+            node = frontier.popleft()
+            if node is None:
+                nulls += 1
+                continue
+            if not first:
+                buf.append(", ")
+            buf.append("null, " * nulls + json.dumps(str(node.value)))
+            first = False
+            nulls = 0
+            frontier.append(node.left)
+            frontier.append(node.right)
+            if len(buf) >= EXPORT_CHUNK:
+                yield "".join(buf)
+                buf = []
+        buf.append("]\n")
+    elif fmt == "edges":
+        for node, parent, side in _level_order(root):
+            if parent is None:
+                buf.append(f"{node.value}\n")
+            else:
+                buf.append(f"{parent.value}\t{node.value}\t{side}\n")
+                if len(buf) >= EXPORT_CHUNK:
+                    yield "".join(buf)
+                    buf = []
+    else:
+        for node, _, _ in _level_order(root):
+            buf.append(f"{node.value}\n")
+            if len(buf) >= EXPORT_CHUNK:
+                yield "".join(buf)
+                buf = []
+    yield "".join(buf)
+
+
+@app.route("/tree/import", methods=["POST"])
+def tree_import():
+    upload = request.files.get("file")
+    fmt = request.form.get("format", "level")
+    if upload is None or fmt not in TREE_FORMATS:
+        return Response("Upload a file and choose one of: " + ", ".join(TREE_FORMATS), 400,
+                        mimetype="text/plain")
+    try:
+        with span("import"):
+            root = import_tree(upload.stream, fmt)
+    except (TreeImportError, UnicodeDecodeError, csv.Error) as exc:
+        return Response(f"Import failed: {exc}", 400, mimetype="text/plain")
+
+    hist = get_tree_history()
+    tree = PersistentTree()
+    tree.root = root
+    commit_tree(hist, tree, f"import ({fmt})", keeps_order=False)
+    return _back_to_tree_page()
+
+
+@app.route("/tree/export", methods=["GET"])
+def tree_export():
+    fmt = request.args.get("format", "level")
+    if fmt not in TREE_FORMATS:
+        return Response("format must be one of: " + ", ".join(TREE_FORMATS), 400, mimetype="text/plain")
+    name = active_tree_name()
+    root = rebuild_tree(name, lazy=True).root
+    ext = "json" if fmt == "level" else "txt"
+    return Response(stream_with_context(export_tree(root, fmt)), mimetype="text/plain",
+                    headers={"Content-Disposition": f'attachment; filename="{name}-{fmt}.{ext}"'})
+
+
+# ---------------------------
+# Tree workspace routes
+# ---------------------------
+@app.route("/trees", methods=["GET"])
+def trees_list():
+    return jsonify({"active": {page: active_tree_name(page) for page in DEFAULT_TREES},
+                    "trees": list_tree_workspaces()})
+
+
+@app.route("/trees/create", methods=["POST"])
+def trees_create():
+    name = request.form.get("name", "").strip()
+    if valid_tree_name(name) and (name in tree_meta() or len(tree_meta()) < MAX_TREES):
+        if name not in tree_meta():
+            update_tree_meta(name, size=0, height=-1, version=0, ordered=True)
+        set_active_tree(tree_page(), name)
+    return _back_to_tree_page()
+
+
+@app.route("/trees/switch", methods=["POST"])
+def trees_switch():
+    name = request.form.get("name", "").strip()
+    if name in tree_meta() or name in DEFAULT_TREES.values():
+        set_active_tree(tree_page(), name)
+    return _back_to_tree_page()
+
+
+@app.route("/trees/delete", methods=["POST"])
+def trees_delete():
+    name = request.form.get("name", "").strip()
+    meta = dict(tree_meta())
+    if meta.pop(name, None) is not None:
+        session["tree_meta"] = meta
+    drop_tree_data(name)
+    for page, default in DEFAULT_TREES.items():
+        if active_tree_name(page) == name and name != default:
+            set_active_tree(page, default)
+    return _back_to_tree_page()
+
+
 # CONTACT PAGE ROUTE
 @app.route("/contact")
+@cached_page
 def contact():
     return render_template("contact.html")
 
 
+# ---------------------------
+# Station name index (typeahead / fuzzy resolution)
+# ---------------------------
+def normalize_station(name):
+    """Case-, accent- and punctuation-insensitive key: "Santolan (LRT2)" -> "santolan lrt2"."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    cleaned = "".join(ch if ch.isalnum() else " " for ch in stripped.casefold())
+    return " ".join(cleaned.split())
+
+
+class _TrieNode:
+    __slots__ = ("children", "names", "terminal")
+
+    def __init__(self):
+        self.children = {}
+        self.names = set()     # every station reachable below this prefix
+        self.terminal = set()  # stations whose key ends exactly here
+
+
+class StationIndex:
+    """Prefix trie over normalized station names.
+
+    Every word start is indexed too, so "mapa" finds "v Mapa" and
+    "lrt2" finds "Santolan (LRT2)".
+    """
+
+    def __init__(self, names):
+        self.root = _TrieNode()
+        self.by_key = {}
+        for name in names:
+            key = normalize_station(name)
+            self.by_key.setdefault(key, []).append(name)
+            words = key.split(" ")
+            for i in range(len(words)):
+                self._add(" ".join(words[i:]), name)
+
+    def _add(self, key, name):
+        node = self.root
+        node.names.add(name)
+        for ch in key:
+            node = node.children.setdefault(ch, _TrieNode())
+            node.names.add(name)
+        node.terminal.add(name)
+
+    def prefix(self, query):
+        node = self.root
+        for ch in normalize_station(query):
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return sorted(node.names)
+
+    def fuzzy(self, query, max_distance=None):
+        """Stations with an indexed key within max_distance edits of query.
+
+        Walks the trie carrying one Levenshtein DP row per node, pruning any
+        branch whose row minimum already exceeds the bound.
+        Returns [(distance, name), ...] sorted best-first.
+        """
+        key = normalize_station(query)
+        if max_distance is None:
+            max_distance = 1 if len(key) < 5 else 2
+        best = {}
+        first_row = list(range(len(key) + 1))
+
+        stack = [(child, ch, first_row) for ch, child in self.root.children.items()]
+        while stack:
+            node, ch, prev = stack.pop()
+            row = [prev[0] + 1]
+            for i in range(1, len(key) + 1):
+                cost = 0 if key[i - 1] == ch else 1
+                row.append(min(row[i - 1] + 1, prev[i] + 1, prev[i - 1] + cost))
+            if row[-1] <= max_distance:
+                for name in node.terminal:
+                    if row[-1] < best.get(name, max_distance + 1):
+                        best[name] = row[-1]
+            if min(row) <= max_distance:
+                stack.extend((child, c, row) for c, child in node.children.items())
+        return sorted((d, name) for name, d in best.items())
+
+    def suggest(self, query, limit=10):
+        """Prefix matches first, then fuzzy matches, without duplicates."""
+        out = self.prefix(query)[:limit]
+        if len(out) < limit:
+            seen = set(out)
+            for _, name in self.fuzzy(query):
+                if name not in seen:
+                    out.append(name)
+                    seen.add(name)
+                    if len(out) == limit:
+                        break
+        return out
+
+    def resolve(self, query):
+        """Best single station for free-text input, or None if ambiguous/unknown."""
+        matches = self.by_key.get(normalize_station(query), [])
+        if len(matches) == 1:
+            return matches[0]
+        candidates = self.prefix(query)
+        if len(candidates) == 1:
+            return candidates[0]
+        fuzzy = self.fuzzy(query)
+        if fuzzy and (len(fuzzy) == 1 or fuzzy[0][0] < fuzzy[1][0]):
+            return fuzzy[0][1]
+        return None
+
+
 # ---------------------------
 # MRT/LRT Graph Structure with BFS
 # ---------------------------
+class GraphEditError(ValueError):
+    pass
+
+
 class MRTGraph:
-    def __init__(self):
+    """Immutable network snapshot; edits produce a new graph via with_edits()."""
+
+    def __init__(self, stations=None, closed_stations=(), closed_segments=(), version=0):
         # MRT Line 3 (Blue), LRT Line 1 (Yellow), LRT Line 2 (Purple/Violet)
         # Transfer stations (where lines physically intersect):
         # - Araneta Center-Cubao: MRT3 ↔ LRT2 (lines intersect)
@@ -782,7 +3353,7 @@ class MRTGraph:
         # - Recto/Doroteo Jose: LRT2 ↔ LRT1 (lines intersect)
         # Note: Duplicate station names (e.g., "Santolan") are separate stations in the same area, NOT connected
         
-        self.stations = {
+        default_stations = {
             # MRT Line 3 
             "North Avenue": ["Quezon Avenue"],
             "Quezon Avenue": ["North Avenue", "GMA Kamuning"],
@@ -833,11 +3404,126 @@ class MRTGraph:
             "EDSA": ["Libertad", "Baclaran", "Taft Avenue"],  # Transfer to MRT3
             "Baclaran": ["EDSA"]
         }
+        if stations is None:
+            stations = default_stations
+        self.stations = MappingProxyType({name: tuple(nbrs) for name, nbrs in stations.items()})
+        self.closed_stations = frozenset(closed_stations)
+        self.closed_segments = frozenset(frozenset(seg) for seg in closed_segments)
+        self.version = version
+        # derived: the graph BFS actually walks, with closures removed
+        self.adjacency = MappingProxyType({
+            name: tuple(n for n in nbrs
+                        if n not in self.closed_stations and frozenset((name, n)) not in self.closed_segments)
+            for name, nbrs in self.stations.items()
+        })
+        self.sorted_stations = sorted(self.stations)
+        self._index = None
+        self._compiled = None
+
+    def __reduce__(self):
+        # for the worker pool; derived tables are rebuilt on the other side
+        return (MRTGraph, (dict(self.stations), self.closed_stations,
+                           [tuple(seg) for seg in self.closed_segments], self.version))
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = StationIndex(self.stations)
+        return self._index
+
+    def summary(self):
+        return {"version": self.version, "stations": len(self.stations),
+                "closed_stations": sorted(self.closed_stations),
+                "closed_segments": sorted(sorted(seg) for seg in self.closed_segments)}
+
+    def with_edits(self, edits):
+        """New snapshot (version + 1) with the edits applied in order.
+
+        Ops: add_station {name, neighbors}, remove_station {name},
+        connect/disconnect {a, b}, close_station/open_station {name},
+        close_segment/open_segment {a, b}. Raises GraphEditError.
+        """
+        stations = {name: list(nbrs) for name, nbrs in self.stations.items()}
+        closed_stations = set(self.closed_stations)
+        closed_segments = set(self.closed_segments)
+
+        def station_name(value, field):
+            if not isinstance(value, str):
+                raise GraphEditError(f"'{field}' must be a station name, not {type(value).__name__}.")
+            return value
+
+        def known(name, field="name"):
+            name = station_name(name, field)
+            if name not in stations:
+                hint = self.resolve_station(str(name))
+                raise GraphEditError(f"Unknown station '{name}'" + (f" (did you mean '{hint}'?)" if hint else "") + ".")
+            return name
+
+        def segment(edit):
+            a, b = known(edit.get("a"), "a"), known(edit.get("b"), "b")
+            if b not in stations[a]:
+                raise GraphEditError(f"No segment between '{a}' and '{b}'.")
+            return frozenset((a, b))
+
+        for edit in edits:
+            op = edit.get("op") if isinstance(edit, dict) else None
+            if op == "add_station":
+                name = station_name(edit.get("name", ""), "name").strip()
+                if not name or name in stations:
+                    raise GraphEditError(f"Station name '{name}' is empty or already taken.")
+                neighbors = edit.get("neighbors", [])
+                if not isinstance(neighbors, list):
+                    raise GraphEditError("'neighbors' must be a list of station names.")
+                neighbors = [known(n, "neighbors") for n in neighbors]
+                if len(set(neighbors)) != len(neighbors):
+                    raise GraphEditError(f"'neighbors' of '{name}' lists a station more than once.")
+                stations[name] = []
+                for n in neighbors:
+                    stations[name].append(n)
+                    stations[n].append(name)
+            elif op == "remove_station":
+                name = known(edit.get("name"))
+                for n in stations.pop(name):
+                    stations[n] = [m for m in stations[n] if m != name]
+                closed_stations.discard(name)
+                closed_segments = {seg for seg in closed_segments if name not in seg}
+            elif op == "connect":
+                a, b = known(edit.get("a"), "a"), known(edit.get("b"), "b")
+                if a == b or b in stations[a]:
+                    raise GraphEditError(f"'{a}' and '{b}' are already connected.")
+                stations[a].append(b)
+                stations[b].append(a)
+            elif op == "disconnect":
+                seg = segment(edit)
+                a, b = tuple(seg)
+                stations[a].remove(b)
+                stations[b].remove(a)
+                closed_segments.discard(seg)
+            elif op == "close_station":
+                closed_stations.add(known(edit.get("name")))
+            elif op == "open_station":
+                closed_stations.discard(known(edit.get("name")))
+            elif op == "close_segment":
+                closed_segments.add(segment(edit))
+            elif op == "open_segment":
+                closed_segments.discard(segment(edit))
+            else:
+                raise GraphEditError(f"Unknown edit op '{op}'.")
+        return MRTGraph(stations, closed_stations, closed_segments, self.version + 1)
+
+    def resolve_station(self, name):
+        """Exact name if known, otherwise the index's best candidate (or None)."""
+        if name in self.stations:
+            return name
+        return self.index.resolve(name)
 
     def bfs_shortest_path(self, start, end):
         """Find shortest path using BFS (Breadth-First Search) with Python queue."""
         if start not in self.stations or end not in self.stations:
             return None, "One or both stations not found."
+        closed = [name for name in (start, end) if name in self.closed_stations]
+        if closed:
+            return None, f"{' and '.join(closed)} {'is' if len(closed) == 1 else 'are'} closed."
         
         if start == end:
             return [start], f"Already at {start}."
@@ -846,24 +3532,200 @@ class MRTGraph:
         queue = Queue()
         queue.enqueue((start, [start]))  
         visited = {start}
+        expanded = copies = copied_items = 0
         
-        while queue.head is not None:
-            current, path = queue.dequeue()
-            
-            # lf neighbor
-            for neighbor in self.stations.get(current, []):
-                if neighbor == end:
-                    return path + [neighbor], None
+        try:
+            while queue.head is not None:
+                current, path = queue.dequeue()
+                expanded += 1
                 
-                if neighbor not in visited:
-                    visited.add(neighbor)
-                    queue.enqueue((neighbor, path + [neighbor]))
-        
-        return None, "No path found between stations."
+                # lf neighbor
+                for neighbor in self.adjacency.get(current, ()):
+                    if neighbor == end:
+                        copies += 1
+                        copied_items += len(path) + 1
+                        return path + [neighbor], None
+                    
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        copies += 1
+                        copied_items += len(path) + 1
+                        queue.enqueue((neighbor, path + [neighbor]))
+            
+            return None, "No path found between stations."
+        finally:
+            count_op("bfs.expanded", expanded)
+            count_op("bfs.path_copies", copies)
+            count_op("bfs.path_copy_items", copied_items)
+
+    @property
+    def compiled(self):
+        """Open adjacency as integer arrays, both directions.
+
+        (ids, out_ptr, out_idx, src, in_ptr): out_idx[out_ptr[u]:out_ptr[u + 1]]
+        are u's neighbours (CSR); src[in_ptr[v]:in_ptr[v + 1]] are the
+        stations with an edge into v (CSC). Closed stations have no edges.
+        With NumPy, src ends with a sentinel column N that is never in a
+        frontier, so every reduceat segment start is a valid index.
+        """
+        if self._compiled is None:
+            ids = {name: i for i, name in enumerate(self.sorted_stations)}
+            outgoing = [[] for _ in ids]
+            incoming = [[] for _ in ids]
+            for name, nbrs in self.adjacency.items():
+                if name in self.closed_stations:
+                    continue
+                for n in nbrs:
+                    outgoing[ids[name]].append(ids[n])
+                    incoming[ids[n]].append(ids[name])
+            out_ptr, in_ptr = [0], [0]
+            for out, inc in zip(outgoing, incoming):
+                out_ptr.append(out_ptr[-1] + len(out))
+                in_ptr.append(in_ptr[-1] + len(inc))
+            out_idx = [v for out in outgoing for v in out]
+            src = [u for inc in incoming for u in inc]
+            if np is not None:
+                out_ptr = np.array(out_ptr, dtype=np.int64)
+                out_idx = np.array(out_idx, dtype=np.int64)
+                src = np.array(src + [len(ids)], dtype=np.int64)
+                in_ptr = np.array(in_ptr, dtype=np.int64)
+            self._compiled = (ids, out_ptr, out_idx, src, in_ptr)
+        return self._compiled
+
+    def hop_distances(self, sources, max_hops=None):
+        """Hop counts from each source to every station (-1 = unreachable).
+
+        Level-synchronous BFS for all sources at once, one vectorized step
+        per level. Rows follow `sources`, columns follow self.sorted_stations.
+        Wide levels are expanded bottom-up over a boolean frontier
+        mask (gather along the edge array, segmented OR per destination);
+        narrow ones top-down from the frontier's (source, station) pairs, so
+        long thin searches do not pay for the whole edge array every level.
+        """
+        ids, out_ptr, out_idx, src, in_ptr = self.compiled
+        rows = [ids[name] for name in sources]
+        if np is None:
+            return self._hop_distances_python(rows, max_hops)
+        n, s = len(ids), len(rows)
+        has_in = (in_ptr[1:] > in_ptr[:-1])[:, None]
+        degree = out_ptr[1:] - out_ptr[:-1]
+        dense_cost = s * len(out_idx)
+        # station-major (N, S) layout: a gather along the edge array copies
+        # whole contiguous rows, one row per edge
+        dist = np.full((n, s), -1, dtype=np.int32)
+        visited = np.zeros((n, s), dtype=bool)
+        slot = np.zeros(n * s, dtype=np.int64)  # scratch for de-duplicating pairs
+        f_cols = np.array(rows, dtype=np.int64)
+        f_rows = np.arange(s)
+        visited[f_cols, f_rows] = True
+        dist[f_cols, f_rows] = 0
+        level = dense_levels = 0
+        while len(f_cols) and (max_hops is None or level < max_hops):
+            level += 1
+            deg = degree[f_cols]
+            if deg.sum() * 32 > dense_cost:
+                dense_levels += 1
+                frontier = np.zeros((n + 1, s), dtype=bool)
+                frontier[f_cols, f_rows] = True
+                # reached[v, r] = any(frontier[u, r] for u -> v), on the mask
+                # packed 8 sources per byte to cut the gathered volume 8x
+                packed = np.packbits(frontier, axis=1, bitorder="little")
+                reached = np.bitwise_or.reduceat(packed[src], in_ptr[:-1], axis=0)
+                reached = np.unpackbits(reached, axis=1, count=s, bitorder="little").view(bool)
+                f_cols, f_rows = np.nonzero(reached & has_in & ~visited)
+            else:
+                # every (u, r) in the frontier fans out to (v, r) for u's neighbours
+                total = int(deg.sum())
+                starts = np.repeat(out_ptr[f_cols] - np.cumsum(deg) + deg, deg)
+                cols = out_idx[starts + np.arange(total)]
+                r = np.repeat(f_rows, deg)
+                fresh = ~visited[cols, r]
+                cols, r = cols[fresh], r[fresh]
+                keys = cols * s + r
+                order = np.arange(len(keys))
+                slot[keys] = order
+                first = slot[keys] == order  # one survivor per duplicate pair
+                f_cols, f_rows = cols[first], r[first]
+            visited[f_cols, f_rows] = True
+            dist[f_cols, f_rows] = level
+        count_op("bfs.levels", level)
+        count_op("bfs.dense_levels", dense_levels)
+        count_op("bfs.sources", s)
+        return dist.T
+
+    def _hop_distances_python(self, rows, max_hops):
+        ids, out_ptr, out_idx, _, _ = self.compiled
+        result = []
+        for row in rows:
+            dist = [-1] * len(ids)
+            dist[row] = 0
+            frontier, level = [row], 0
+            while frontier and (max_hops is None or level < max_hops):
+                level += 1
+                nxt = []
+                for u in frontier:
+                    for v in out_idx[out_ptr[u]:out_ptr[u + 1]]:
+                        if dist[v] < 0:
+                            dist[v] = level
+                            nxt.append(v)
+                frontier = nxt
+            result.append(dist)
+        return result
+
+    def isochrone(self, station, max_hops):
+        """Stations reachable within max_hops stops, grouped by hop count."""
+        dist = self.hop_distances([station], max_hops)[0]
+        levels = [[] for _ in range(max_hops + 1)]
+        for name, d in zip(self.sorted_stations, dist):
+            if d >= 0:
+                levels[d].append(name)
+        while len(levels) > 1 and not levels[-1]:
+            levels.pop()
+        return levels
+
+    def distance_matrix(self, sources=None):
+        """Hop-distance rows for `sources` (default: every station); None = unreachable."""
+        sources = list(sources) if sources is not None else self.sorted_stations
+        dist = self.hop_distances(sources)
+        return [[d if d >= 0 else None for d in (row.tolist() if np is not None else row)] for row in dist]
+
+
+
+# The published snapshot. Readers take one reference per request (use_graph)
+# and never lock; edits build a new snapshot on a single background thread,
+# warm its station index, then rebind this name, which is atomic.
+mrt_graph = MRTGraph()
+MAX_GRAPH_EDITS = 100
+GRAPH_EDIT_TIMEOUT = 10.0
+_graph_rebuilds = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graph-rebuild")
 
 
+def use_graph():
+    """Current graph snapshot, remembered for this request's X-Graph-Version header."""
+    graph = mrt_graph
+    g.graph_version = graph.version
+    return graph
+
+
+@app.after_request
+def _graph_version_header(response):
+    version = g.get("graph_version")
+    if version is not None:
+        response.headers["X-Graph-Version"] = str(version)
+    return response
+
+
+def _publish_graph_edits(edits):
+    global mrt_graph
+    graph = mrt_graph.with_edits(edits)
+    graph.index  # build derived indexes before readers can see the snapshot
+    mrt_graph = graph
+    return graph
 
-mrt_graph = MRTGraph()
+
+def submit_graph_edits(edits):
+    """Queue edits behind any pending ones; returns a future for the new snapshot."""
+    return _graph_rebuilds.submit(_publish_graph_edits, edits)
 
 
 @app.route("/graph", methods=["GET", "POST"])
@@ -873,13 +3735,17 @@ def graph():
     path = []
     start_station = ""
     end_station = ""
+    graph = use_graph()
     
     if request.method == "POST":
         start_station = request.form.get("start_station", "").strip()
         end_station = request.form.get("end_station", "").strip()
         
         if start_station and end_station:
-            path, error = mrt_graph.bfs_shortest_path(start_station, end_station)
+            start_station = graph.resolve_station(start_station) or start_station
+            end_station = graph.resolve_station(end_station) or end_station
+            with span("bfs"):
+                path, error = graph.bfs_shortest_path(start_station, end_station)
             if error:
                 message = f"Error: {error}"
             elif path:
@@ -890,27 +3756,161 @@ def graph():
         else:
             message = "Please select both start and end stations."
     
-    
-    all_stations = sorted(mrt_graph.stations.keys())
-    
     return render_template("graph.html", 
-                         stations=all_stations,
                          path=path,
                          start_station=start_station,
                          end_station=end_station,
-                         message=message)
+                         message=message,
+                         graph=graph.summary())
+
+
+MAX_BATCH_PAIRS = 1000
+
+
+def batch_shortest_paths(pairs, graph):
+    """Worker-side entry: BFS for many (start, end) pairs on one snapshot."""
+    results = []
+    for start, end in pairs:
+        path, error = graph.bfs_shortest_path(start, end)
+        results.append({"start": start, "end": end, "path": path, "error": error})
+    return results
+
+
+def _batch_pairs(graph):
+    data = request.get_json(silent=True) or {}
+    pairs = data.get("pairs")
+    if (not isinstance(pairs, list) or len(pairs) > MAX_BATCH_PAIRS
+            or not all(isinstance(p, list) and len(p) == 2 for p in pairs)):
+        return None
+    return [(graph.resolve_station(str(a)) or str(a), graph.resolve_station(str(b)) or str(b))
+            for a, b in pairs]
+
+
+@app.route("/graph/batch", methods=["POST"])
+def graph_batch():
+    """Shortest paths for {"pairs": [["Boni", "v Mapa"], ...]}."""
+    graph = use_graph()
+    pairs = _batch_pairs(graph)
+    if pairs is None:
+        return {"error": f"pairs must be a list of at most {MAX_BATCH_PAIRS} [start, end] pairs."}, 400
+    with span("bfs"):
+        results = worker_pool.run(batch_shortest_paths, pairs, graph, cost=len(pairs) * 50)
+    return {"graph_version": graph.version, "results": results}
+
+
+@app.route("/graph/stations")
+def graph_stations():
+    """JSON typeahead: /graph/stations?q=cub -> {"query": "cub", "matches": [...]}"""
+    query = request.args.get("q", "").strip()
+    try:
+        limit = max(1, min(int(request.args.get("limit", 10)), 50))
+    except ValueError:
+        limit = 10
+    graph = use_graph()
+    matches = graph.index.suggest(query, limit) if query else graph.sorted_stations[:limit]
+    return jsonify({"query": query, "matches": matches, "graph_version": graph.version})
+
+
+MAX_ISOCHRONE_HOPS = 50
+
+
+@app.route("/graph/isochrone")
+def graph_isochrone():
+    """Stations within k stops: /graph/isochrone?station=Boni&k=3 -> {"levels": [[...], ...]}"""
+    graph = use_graph()
+    name = request.args.get("station", "").strip()
+    station = graph.resolve_station(name) if name else None
+    if station is None:
+        return {"error": f"Unknown station '{name}'.", "graph_version": graph.version}, 404
+    if station in graph.closed_stations:
+        return {"error": f"{station} is closed.", "graph_version": graph.version}, 409
+    k = request.args.get("k", 3, type=int)
+    if k is None or not 0 <= k <= MAX_ISOCHRONE_HOPS:
+        return {"error": f"k must be an integer from 0 to {MAX_ISOCHRONE_HOPS}."}, 400
+    with span("bfs"):
+        levels = graph.isochrone(station, k)
+    return {"graph_version": graph.version, "station": station, "k": k,
+            "reachable": sum(len(level) for level in levels), "levels": levels}
+
+
+@app.route("/graph/distances")
+def graph_distances():
+    """Hop-distance matrix: /graph/distances[?from=Boni,Recto]; null = unreachable."""
+    graph = use_graph()
+    names = [n.strip() for n in request.args.get("from", "").split(",") if n.strip()]
+    sources = [graph.resolve_station(n) for n in names]
+    if None in sources:
+        return {"error": f"Unknown station '{names[sources.index(None)]}'.", "graph_version": graph.version}, 404
+    with span("bfs"):
+        matrix = graph.distance_matrix(sources or None)
+    return {"graph_version": graph.version, "sources": sources or graph.sorted_stations,
+            "stations": graph.sorted_stations, "matrix": matrix}
+
+
+@app.route("/graph/version")
+def graph_version():
+    return jsonify(use_graph().summary())
+
+
+@app.route("/graph/admin/edits", methods=["POST"])
+def graph_admin_edits():
+    """Apply {"edits": [{"op": "close_station", "name": "Boni"}, ...]} as one new snapshot.
+
+    Needs the X-Admin-Token header to match APP_ADMIN_TOKEN; disabled when unset.
+    """
+    token = os.environ.get("APP_ADMIN_TOKEN", "")
+    if not token or not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token):
+        return {"error": "Graph admin API is disabled or the token is wrong."}, 403
+    payload = request.get_json(silent=True)
+    edits = payload.get("edits") if isinstance(payload, dict) else None
+    if not isinstance(edits, list) or not 0 < len(edits) <= MAX_GRAPH_EDITS:
+        return {"error": f"edits must be a list of 1 to {MAX_GRAPH_EDITS} edit objects."}, 400
+    try:
+        graph = submit_graph_edits(edits).result(timeout=GRAPH_EDIT_TIMEOUT)
+    except GraphEditError as e:
+        return {"error": str(e)}, 400
+    except FutureTimeout:
+        return {"error": "Edit queued but not yet published; check /graph/version."}, 202
+    g.graph_version = graph.version
+    return {"previous_version": graph.version - 1, **graph.summary()}
 
 
 # ---------------------------
 # Sorting Algorithms
 # ---------------------------
+MAX_TRACE_CELLS = 1_000_000  # steps x array length; each step holds a full copy of the array
+
+
+class TraceTooLarge(Exception):
+    pass
+
+
+class StepLog(list):
+    """Step list for a traced sort; stops the sort once steps x n would pass MAX_TRACE_CELLS."""
+
+    def __init__(self, n):
+        super().__init__()
+        self.limit = max(1, MAX_TRACE_CELLS // max(n, 1))
+
+    def append(self, step):
+        if len(self) >= self.limit:
+            raise TraceTooLarge(f"The trace would exceed {self.limit} steps for "
+                                f"{len(step['array'])} values; send fewer values.")
+        super().append(step)
+
+
+def _count_trace(steps, n):
+    """Every recorded step holds one full copy of the array."""
+    count_op("sort.array_copies", len(steps))
+    count_op("sort.copied_items", len(steps) * n)
+
 def bubble_sort(arr):
     """Bubble Sort - compares adjacent elements and swaps them.
     Time Complexity: O(n²) - Best: O(n), Worst: O(n²), Average: O(n²)
     Space Complexity: O(1)
     """
     arr = arr.copy()
-    steps = []
+    steps = StepLog(len(arr))
     n = len(arr)
     
     for i in range(n):
@@ -925,6 +3925,7 @@ def bubble_sort(arr):
             break
     
     steps.append({"array": arr.copy(), "comparing": [], "sorted": list(range(n))})
+    _count_trace(steps, n)
     return arr, steps
 
 def selection_sort(arr):
@@ -933,7 +3934,7 @@ def selection_sort(arr):
     Space Complexity: O(1)
     """
     arr = arr.copy()
-    steps = []
+    steps = StepLog(len(arr))
     n = len(arr)
     
     for i in range(n):
@@ -948,6 +3949,7 @@ def selection_sort(arr):
             steps.append({"array": arr.copy(), "swapped": [i, min_idx], "sorted": list(range(i+1))})
     
     steps.append({"array": arr.copy(), "comparing": [], "sorted": list(range(n))})
+    _count_trace(steps, n)
     return arr, steps
 
 def insertion_sort(arr):
@@ -956,7 +3958,7 @@ def insertion_sort(arr):
     Space Complexity: O(1)
     """
     arr = arr.copy()
-    steps = []
+    steps = StepLog(len(arr))
     n = len(arr)
     
     for i in range(1, n):
@@ -973,6 +3975,7 @@ def insertion_sort(arr):
         steps.append({"array": arr.copy(), "comparing": [], "sorted": list(range(i+1))})
     
     steps.append({"array": arr.copy(), "comparing": [], "sorted": list(range(n))})
+    _count_trace(steps, n)
     return arr, steps
 
 def merge_sort(arr):
@@ -980,7 +3983,7 @@ def merge_sort(arr):
     Time Complexity: O(n log n) - Best: O(n log n), Worst: O(n log n), Average: O(n log n)
     Space Complexity: O(n)
     """
-    steps = []
+    steps = StepLog(len(arr))
     
     def merge_sort_helper(arr, left, right):
         if left < right:
@@ -991,38 +3994,42 @@ def merge_sort(arr):
             merge(arr, left, mid, right)
     
     def merge(arr, left, mid, right):
-        left_part = arr[left:mid + 1]
-        right_part = arr[mid + 1:right + 1]
+        # copy the run into the shared aux buffer instead of slicing two new lists
+        for t in range(left, right + 1):
+            aux[t] = arr[t]
         
-        i = j = 0
+        i = left
+        j = mid + 1
         k = left
         
-        while i < len(left_part) and j < len(right_part):
-            steps.append({"array": arr.copy(), "comparing": [left + i, mid + 1 + j], "sorted": []})
-            if left_part[i] <= right_part[j]:
-                arr[k] = left_part[i]
+        while i <= mid and j <= right:
+            steps.append({"array": arr.copy(), "comparing": [i, j], "sorted": []})
+            if aux[i] <= aux[j]:
+                arr[k] = aux[i]
                 i += 1
             else:
-                arr[k] = right_part[j]
+                arr[k] = aux[j]
                 j += 1
             k += 1
             steps.append({"array": arr.copy(), "comparing": [], "sorted": []})
         
-        while i < len(left_part):
-            arr[k] = left_part[i]
+        while i <= mid:
+            arr[k] = aux[i]
             i += 1
             k += 1
             steps.append({"array": arr.copy(), "comparing": [], "sorted": []})
         
-        while j < len(right_part):
-            arr[k] = right_part[j]
+        while j <= right:
+            arr[k] = aux[j]
             j += 1
             k += 1
             steps.append({"array": arr.copy(), "comparing": [], "sorted": []})
     
     arr = arr.copy()
+    aux = [None] * len(arr)
     merge_sort_helper(arr, 0, len(arr) - 1)
     steps.append({"array": arr.copy(), "comparing": [], "sorted": list(range(len(arr)))})
+    _count_trace(steps, len(arr))
     return arr, steps
 
 def quicksort(arr):
@@ -1030,7 +4037,7 @@ def quicksort(arr):
     Time Complexity: O(n log n) - Best: O(n log n), Worst: O(n²), Average: O(n log n)
     Space Complexity: O(log n)
     """
-    steps = []
+    steps = StepLog(len(arr))
     
     def quicksort_helper(arr, low, high):
         if low < high:
@@ -1039,75 +4046,838 @@ def quicksort(arr):
             quicksort_helper(arr, pi + 1, high)
     
     def partition(arr, low, high):
-        pivot = arr[high]
-        i = low - 1
-        
-        steps.append({"array": arr.copy(), "comparing": [high], "sorted": [], "pivot": high})
-        
-        for j in range(low, high):
-            steps.append({"array": arr.copy(), "comparing": [j, high], "sorted": [], "pivot": high})
-            if arr[j] < pivot:
-                i += 1
-                arr[i], arr[j] = arr[j], arr[i]
-                steps.append({"array": arr.copy(), "swapped": [i, j], "sorted": [], "pivot": high})
-        
-        arr[i + 1], arr[high] = arr[high], arr[i + 1]
-        steps.append({"array": arr.copy(), "swapped": [i+1, high], "sorted": []})
-        return i + 1
+        return _partition(arr, low, high, steps)
     
     arr = arr.copy()
     quicksort_helper(arr, 0, len(arr) - 1)
     steps.append({"array": arr.copy(), "comparing": [], "sorted": list(range(len(arr)))})
+    _count_trace(steps, len(arr))
     return arr, steps
 
+def _partition(arr, low, high, steps, done=()):
+    """Lomuto partition of arr[low..high] around arr[high], used by quicksort.
+    Returns the pivot's final index; done lists indices already in their final place.
+    """
+    pivot = arr[high]
+    i = low - 1
+    
+    steps.append({"array": arr.copy(), "comparing": [high], "sorted": list(done), "pivot": high})
+    
+    for j in range(low, high):
+        steps.append({"array": arr.copy(), "comparing": [j, high], "sorted": list(done), "pivot": high})
+        if arr[j] < pivot:
+            i += 1
+            arr[i], arr[j] = arr[j], arr[i]
+            steps.append({"array": arr.copy(), "swapped": [i, j], "sorted": list(done), "pivot": high})
+    
+    arr[i + 1], arr[high] = arr[high], arr[i + 1]
+    steps.append({"array": arr.copy(), "swapped": [i+1, high], "sorted": list(done)})
+    return i + 1
+
+def _partition3(arr, low, high, steps, done=()):
+    """Three-way (Dutch national flag) partition of arr[low..high] around arr[low], used by quickselect.
+    Returns (lt, gt): arr[lt..gt] all equal the pivot, so a run of duplicates is settled in one pass.
+    """
+    pivot = arr[low]
+    lt, i, gt = low, low + 1, high
+    
+    steps.append({"array": arr.copy(), "comparing": [low], "sorted": list(done), "pivot": low})
+    
+    # arr[lt..i-1] == pivot, so arr[lt] always holds a copy of it
+    while i <= gt:
+        steps.append({"array": arr.copy(), "comparing": [i, lt], "sorted": list(done), "pivot": lt})
+        if arr[i] < pivot:
+            arr[lt], arr[i] = arr[i], arr[lt]
+            lt += 1
+            i += 1
+            steps.append({"array": arr.copy(), "swapped": [lt - 1, i - 1], "sorted": list(done), "pivot": lt})
+        elif arr[i] > pivot:
+            arr[i], arr[gt] = arr[gt], arr[i]
+            gt -= 1
+            steps.append({"array": arr.copy(), "swapped": [i, gt + 1], "sorted": list(done), "pivot": lt})
+        else:
+            i += 1
+    return lt, gt
+
+def _check_k(k, n):
+    if not 1 <= k <= n:
+        raise ValueError(f"k must be between 1 and {n}.")
+    return k
+
+def quickselect(arr, k):
+    """Quickselect - partitions like quicksort, but only continues into the side holding the k-th smallest.
+    The three-way partition settles every copy of the pivot at once, so duplicates cannot make it quadratic.
+    Time Complexity: O(n) average; after too many lopsided splits the pivot comes from median-of-medians
+    Space Complexity: O(1)
+    k is 1-based. Returns the partitioned array: arr[k-1] is the answer.
+    """
+    arr = arr.copy()
+    steps = StepLog(len(arr))
+    n = len(arr)
+    target = _check_k(k, n) - 1
+    low, high = 0, n - 1
+    done = []
+    bad, max_bad = 0, n.bit_length()
+    
+    while low < high:
+        if bad > max_bad:
+            p = low + arr[low:high + 1].index(_median_of_medians(arr[low:high + 1]))
+            if p != low:
+                arr[p], arr[low] = arr[low], arr[p]
+                steps.append({"array": arr.copy(), "swapped": [p, low], "sorted": list(done), "pivot": low})
+        size = high - low + 1
+        lt, gt = _partition3(arr, low, high, steps, done)
+        done.extend(range(lt, gt + 1))
+        if lt <= target <= gt:
+            break
+        if target < lt:
+            high = lt - 1
+        else:
+            low = gt + 1
+        if high - low + 1 > size * 3 // 4:
+            bad += 1
+    
+    steps.append({"array": arr.copy(), "comparing": [], "sorted": [target]})
+    _count_trace(steps, n)
+    return arr, steps
+
+def top_k(arr, k):
+    """Top-k - streams over the array keeping the k largest values seen in a min-heap in arr[0:k].
+    Time Complexity: O(n log k)
+    Space Complexity: O(1)
+    Returns the array with the k largest values first, largest to smallest.
+    """
+    arr = arr.copy()
+    steps = StepLog(len(arr))
+    n = len(arr)
+    _check_k(k, n)
+    
+    def sift_down(i, size):
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                return
+            if child + 1 < size and arr[child + 1] < arr[child]:
+                child += 1
+            steps.append({"array": arr.copy(), "comparing": [i, child], "sorted": []})
+            if arr[i] <= arr[child]:
+                return
+            arr[i], arr[child] = arr[child], arr[i]
+            steps.append({"array": arr.copy(), "swapped": [i, child], "sorted": []})
+            i = child
+    
+    for i in range(k // 2 - 1, -1, -1):
+        sift_down(i, k)
+    
+    for j in range(k, n):
+        # arr[0] is the smallest of the current top k; a larger value replaces it
+        steps.append({"array": arr.copy(), "comparing": [j, 0], "sorted": []})
+        if arr[j] > arr[0]:
+            arr[0], arr[j] = arr[j], arr[0]
+            steps.append({"array": arr.copy(), "swapped": [0, j], "sorted": []})
+            sift_down(0, k)
+    
+    # heap-sort the prefix so the winners read largest first
+    for end in range(k - 1, 0, -1):
+        arr[0], arr[end] = arr[end], arr[0]
+        steps.append({"array": arr.copy(), "swapped": [0, end], "sorted": []})
+        sift_down(0, end)
+    
+    steps.append({"array": arr.copy(), "comparing": [], "sorted": list(range(k))})
+    _count_trace(steps, n)
+    return arr, steps
+
+
+# ---------------------------
+# Trace-free selection (large inputs)
+# ---------------------------
+SELECT_SMALL = 32  # below this sorting the remainder is cheaper than another partition pass
+
+
+def select_kth(values, k):
+    """k-th smallest (1-based) of values without tracing.
+
+    Random pivots with three-way list partitioning, so duplicates cannot
+    degrade it; after too many lopsided splits the pivot comes from
+    median-of-medians instead.
+    Time Complexity: O(n) expected, Space Complexity: O(n)
+    """
+    values = list(values)
+    k = _check_k(k, len(values)) - 1
+    bad, max_bad = 0, len(values).bit_length()
+    while len(values) > SELECT_SMALL:
+        pivot = _median_of_medians(values) if bad > max_bad else random.choice(values)
+        lows = [v for v in values if v < pivot]
+        if k < len(lows):
+            kept = lows
+        else:
+            highs = [v for v in values if v > pivot]
+            equal = len(values) - len(lows) - len(highs)
+            if k < len(lows) + equal:
+                return pivot
+            k -= len(lows) + equal
+            kept = highs
+        if len(kept) > len(values) * 3 // 4:
+            bad += 1
+        values = kept
+    return sorted(values)[k]
+
+
+def _median_of_medians(values):
+    """Median of the medians of groups of five: at least ~30% of values lie on each side of it."""
+    medians = [sorted(values[i:i + 5])[(min(5, len(values) - i) - 1) // 2] for i in range(0, len(values), 5)]
+    return select_kth(medians, (len(medians) + 1) // 2)
+
+
+def top_k_fast(values, k):
+    """The k largest values, largest first, streaming once over any iterable.
+    Time Complexity: O(n log k), Space Complexity: O(k)
+    """
+    if k < 0:
+        raise ValueError("k must not be negative.")
+    return heapq.nlargest(k, values)
+
+
+# ---------------------------
+# Trace-free / parallel merge sort (large inputs)
+# ---------------------------
+PARALLEL_SORT_THRESHOLD = 50_000  # below this the process pool costs more than it saves
+
+
+def merge_sort_fast(arr):
+    """Bottom-up merge sort without step tracing.
+
+    Uses a single preallocated auxiliary buffer and swaps source/destination
+    on every pass, so no per-merge slices are allocated.
+    Time Complexity: O(n log n), Space Complexity: O(n)
+    """
+    src = list(arr)
+    n = len(src)
+    if n < 2:
+        return src
+    dst = [None] * n
+    width = 1
+    while width < n:
+        for left in range(0, n, 2 * width):
+            mid = min(left + width, n)
+            right = min(left + 2 * width, n)
+            i, j, k = left, mid, left
+            while i < mid and j < right:
+                if src[i] <= src[j]:
+                    dst[k] = src[i]
+                    i += 1
+                else:
+                    dst[k] = src[j]
+                    j += 1
+                k += 1
+            if i < mid:
+                dst[k:right] = src[i:mid]
+            elif j < right:
+                dst[k:right] = src[j:right]
+        src, dst = dst, src
+        width *= 2
+    return src
+
+
+def _sort_shared_chunk(shm_name, start, stop):
+    """Worker: sort src[start:stop] of a shared int64 buffer in place."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = shm.buf.cast("q")
+        view[start:stop] = array("q", merge_sort_fast(view[start:stop]))
+        view.release()
+    finally:
+        shm.close()
+    return start, stop
+
+
+def _fits_int64(arr):
+    return all(type(x) is int and -(1 << 63) <= x < (1 << 63) for x in arr)
+
+
+def parallel_merge_sort(arr, workers=None, pool=None):
+    """Sort a list of integers on the worker pool.
+
+    The input is copied once into a shared-memory int64 buffer; each pool
+    worker sorts its own chunk in place (no pickling of the data), and the
+    sorted chunks are combined with a k-way heap merge. workers is the number
+    of chunks and defaults to the pool's process count. Small inputs, a pool
+    with fewer than two processes, or values that do not fit in int64 fall
+    back to merge_sort_fast; a chunk the pool has no room for is sorted inline.
+    """
+    pool = pool or worker_pool
+    n = len(arr)
+    workers = workers or pool.processes
+    if min(workers, pool.processes) < 2 or n < PARALLEL_SORT_THRESHOLD or not _fits_int64(arr):
+        return merge_sort_fast(arr)
+
+    chunk = -(-n // workers)
+    bounds = [(lo, min(lo + chunk, n)) for lo in range(0, n, chunk)]
+
+    shm = shared_memory.SharedMemory(create=True, size=n * 8)
+    view = None
+    futures = []
+    try:
+        view = shm.buf.cast("q")
+        view[:] = array("q", arr)
+        for lo, hi in bounds:
+            try:
+                futures.append(pool.submit(_sort_shared_chunk, shm.name, lo, hi))
+            except PoolBusy:
+                _sort_shared_chunk(shm.name, lo, hi)
+        for future in futures:
+            future.result()
+        runs = [view[lo:hi].tolist() for lo, hi in bounds]
+    finally:
+        # let every chunk finish before the buffer goes away, even after a failure
+        wait_futures(futures)
+        if view is not None:
+            view.release()
+        shm.close()
+        shm.unlink()
+
+    return list(heapq.merge(*runs))
+
+
+# ---------------------------
+# External merge sort (uploads larger than memory)
+# ---------------------------
+# Uploaded integers are read in blocks and cut into runs of at most
+# EXTERNAL_RUN_ITEMS values. Each run is written as raw int64 to a temp file
+# and sorted in place there by merge_sort_fast on the worker pool, so the
+# job thread only ever holds one unsorted run. The runs are then memory-mapped
+# and k-way merged with heapq.merge, reading EXTERNAL_MERGE_BLOCK values
+# per run at a time, into a newline-separated result file for download.
+EXTERNAL_RUN_ITEMS = int(os.environ.get("APP_EXTERNAL_RUN_ITEMS", "1000000"))
+EXTERNAL_READ_BYTES = 1 << 20
+EXTERNAL_MERGE_BLOCK = 8192
+EXTERNAL_SORT_DIR = os.environ.get("APP_EXTERNAL_SORT_DIR") or None  # None = system temp dir
+EXTERNAL_MAX_UPLOAD_BYTES = int(os.environ.get("APP_EXTERNAL_MAX_UPLOAD_BYTES", str(1 << 30)))
+MAX_EXTERNAL_PENDING = int(os.environ.get("APP_EXTERNAL_MAX_PENDING", "4"))  # queued or running jobs
+MAX_EXTERNAL_JOBS = 8  # jobs remembered, finished ones are forgotten first
+EXTERNAL_JOB_TTL = int(os.environ.get("APP_EXTERNAL_JOB_TTL", "3600"))  # seconds a result is kept
+
+
+class ExternalSortError(ValueError):
+    pass
+
+
+class ExternalSortBusy(Exception):
+    """MAX_EXTERNAL_PENDING jobs are already queued or running."""
+
+
+def iter_int_blocks(stream, block_bytes=EXTERNAL_READ_BYTES):
+    """Integers from a whitespace/comma separated byte stream, as lists per block read."""
+    tail = b""
+    while True:
+        block = stream.read(block_bytes)
+        if not block:
+            break
+        block = tail + block.replace(b",", b" ")
+        tokens = block.split()
+        # a token touching the end of the block may continue in the next one
+        tail = tokens.pop() if tokens and not block[-1:].isspace() else b""
+        yield _parse_ints(tokens)
+    if tail:
+        yield _parse_ints([tail])
+
+
+def _parse_ints(tokens):
+    try:
+        return [int(t) for t in tokens]
+    except ValueError:
+        for bad in tokens:
+            try:
+                int(bad)
+            except ValueError:
+                break
+        raise ExternalSortError(f"'{bad[:40].decode('utf-8', 'replace')}' is not an integer")
+
+
+def _sort_run_file(path):
+    """Worker: sort the int64 run stored at path, in place."""
+    with open(path, "r+b") as f:
+        run = array("q")
+        run.frombytes(f.read())
+        f.seek(0)
+        array("q", merge_sort_fast(run)).tofile(f)
+    return path
+
+
+def _iter_run(path, block=EXTERNAL_MERGE_BLOCK):
+    """Values of a sorted run, read block by block from a memory map."""
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm).cast("q")
+        try:
+            for lo in range(0, len(view), block):
+                yield from view[lo:lo + block].tolist()
+        finally:
+            view.release()
+
+
+class ExternalSortJob:
+    """One upload being sorted; progress fields are read by the status endpoint."""
+
+    def __init__(self, filename):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.dir = tempfile.mkdtemp(prefix="extsort-", dir=EXTERNAL_SORT_DIR)
+        self.input_path = os.path.join(self.dir, "input")
+        self.output_path = os.path.join(self.dir, "sorted.txt")
+        self.phase = "queued"
+        self.error = None
+        self.bytes_total = self.bytes_read = 0
+        self.items = self.runs = self.runs_sorted = self.merged = 0
+        self.started = self.finished = None
+
+    def status(self):
+        progress = 0.0
+        if self.phase == "done":
+            progress = 1.0
+        elif self.phase in ("splitting", "merging"):
+            # reading and run sorting count for the first half, merging for the second
+            split = self.bytes_read / self.bytes_total if self.bytes_total else 1.0
+            runs = self.runs_sorted / self.runs if self.runs else 0.0
+            merge = self.merged / self.items if self.items else 0.0
+            progress = 0.25 * split + 0.25 * runs + 0.5 * merge
+        return {"job": self.id, "filename": self.filename, "phase": self.phase, "error": self.error,
+                "progress": round(progress, 4), "bytes_total": self.bytes_total,
+                "bytes_read": self.bytes_read, "items": self.items, "runs": self.runs,
+                "runs_sorted": self.runs_sorted, "merged": self.merged,
+                "seconds": round((self.finished or time.time()) - self.started, 3) if self.started else 0.0}
+
+    def run(self):
+        self.started = time.time()
+        try:
+            run_paths = self._split()
+            self._merge(run_paths)
+            self.phase = "done"
+        except Exception as e:  # the job thread has no caller; report through status()
+            self.phase, self.error = "error", str(e) or type(e).__name__
+            # nothing to download: drop the runs and partial output now
+            shutil.rmtree(self.dir, ignore_errors=True)
+        finally:
+            self.finished = time.time()
+            with contextlib.suppress(OSError):
+                os.remove(self.input_path)
+
+    def _split(self):
+        self.phase = "splitting"
+        run_paths, inflight, buf = [], [], []
+
+        def spill():
+            path = os.path.join(self.dir, f"run-{len(run_paths):05d}.bin")
+            with open(path, "wb") as f:
+                try:
+                    array("q", buf).tofile(f)
+                except OverflowError:
+                    raise ExternalSortError("values must fit in a signed 64-bit integer")
+            run_paths.append(path)
+            self.runs += 1
+            buf.clear()
+            try:
+                inflight.append(worker_pool.submit(_sort_run_file, path) if worker_pool.processes else None)
+            except PoolBusy:
+                inflight.append(None)
+            if inflight[-1] is None:
+                _sort_run_file(path)
+                self.runs_sorted += 1
+            # keep at most two runs sorting so the pool stays available to requests
+            while len([f for f in inflight if f is not None]) > 2:
+                wait_oldest()
+
+        def wait_oldest():
+            for i, future in enumerate(inflight):
+                if future is not None:
+                    future.result()
+                    inflight[i] = None
+                    self.runs_sorted += 1
+                    return
+
+        with open(self.input_path, "rb") as f:
+            for values in iter_int_blocks(f):
+                self.bytes_read = f.tell()
+                self.items += len(values)
+                lo = 0
+                while lo < len(values):
+                    hi = lo + EXTERNAL_RUN_ITEMS - len(buf)
+                    buf.extend(values[lo:hi])
+                    lo = hi
+                    if len(buf) >= EXTERNAL_RUN_ITEMS:
+                        spill()
+        if buf or not run_paths:
+            spill()
+        while any(f is not None for f in inflight):
+            wait_oldest()
+        return run_paths
+
+    def _merge(self, run_paths):
+        self.phase = "merging"
+        with open(self.output_path, "w", encoding="ascii", newline="\n") as out:
+            batch = []
+            for value in heapq.merge(*(_iter_run(p) for p in run_paths)):
+                batch.append(value)
+                if len(batch) == EXTERNAL_MERGE_BLOCK:
+                    out.write("\n".join(map(str, batch)) + "\n")
+                    self.merged += len(batch)
+                    batch.clear()
+            if batch:
+                out.write("\n".join(map(str, batch)) + "\n")
+                self.merged += len(batch)
+        for path in run_paths:
+            os.remove(path)
+
+
+_external_jobs = OrderedDict()
+_external_jobs_lock = threading.Lock()
+_external_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="external-sort")
+
+
+def _prune_external_jobs(now):
+    """Forget finished jobs past MAX_EXTERNAL_JOBS or EXTERNAL_JOB_TTL; caller holds the lock."""
+    finished = [j for j in _external_jobs.values() if j.phase in ("done", "error")]
+    excess = len(_external_jobs) - MAX_EXTERNAL_JOBS
+    for i, old in enumerate(finished):
+        if i < excess or now - (old.finished or now) > EXTERNAL_JOB_TTL:
+            del _external_jobs[old.id]
+            shutil.rmtree(old.dir, ignore_errors=True)
+
+
+def _sweep_external_dirs(owned, now):
+    """Delete job directories not in owned (a crashed run's, another process's) idle for EXTERNAL_JOB_TTL."""
+    with contextlib.suppress(OSError), os.scandir(EXTERNAL_SORT_DIR or tempfile.gettempdir()) as entries:
+        for entry in entries:
+            if not entry.name.startswith("extsort-") or entry.path in owned:
+                continue
+            with contextlib.suppress(OSError):
+                # a job still writing in there keeps some file's mtime fresh
+                newest = max([entry.stat().st_mtime] + [f.stat().st_mtime for f in os.scandir(entry.path)])
+                if now - newest > EXTERNAL_JOB_TTL:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def start_external_sort(upload):
+    """Save an uploaded file and queue it for sorting; returns the job.
+
+    Raises ExternalSortBusy when MAX_EXTERNAL_PENDING jobs are already queued or running.
+    """
+    now = time.time()
+    with _external_jobs_lock:
+        _prune_external_jobs(now)
+        if sum(j.phase not in ("done", "error") for j in _external_jobs.values()) >= MAX_EXTERNAL_PENDING:
+            raise ExternalSortBusy("Too many files are being sorted; try again shortly.")
+        job = ExternalSortJob(upload.filename or "upload")
+        _external_jobs[job.id] = job  # counts as pending while the upload is saved
+        owned = {j.dir for j in _external_jobs.values()}
+    _sweep_external_dirs(owned, now)
+    try:
+        upload.save(job.input_path)
+    except BaseException:
+        job.phase, job.error, job.finished = "error", "the upload could not be saved", time.time()
+        shutil.rmtree(job.dir, ignore_errors=True)
+        raise
+    job.bytes_total = os.path.getsize(job.input_path)
+    _external_runner.submit(job.run)
+    return job
+
+
+def get_external_job(job_id):
+    with _external_jobs_lock:
+        return _external_jobs.get(job_id)
+
+
+ALGORITHM_INFO = {
+    "bubble": {
+        "name": "Bubble Sort",
+        "time_best": "O(n)",
+        "time_avg": "O(n²)",
+        "time_worst": "O(n²)",
+        "space": "O(1)",
+        "description": "Repeatedly compares adjacent elements and swaps them if they're in wrong order."
+    },
+    "selection": {
+        "name": "Selection Sort",
+        "time_best": "O(n²)",
+        "time_avg": "O(n²)",
+        "time_worst": "O(n²)",
+        "space": "O(1)",
+        "description": "Finds the minimum element and places it at the beginning, repeatedly."
+    },
+    "insertion": {
+        "name": "Insertion Sort",
+        "time_best": "O(n)",
+        "time_avg": "O(n²)",
+        "time_worst": "O(n²)",
+        "space": "O(1)",
+        "description": "Builds the sorted array one element at a time by inserting elements in their correct position."
+    },
+    "merge": {
+        "name": "Merge Sort",
+        "time_best": "O(n log n)",
+        "time_avg": "O(n log n)",
+        "time_worst": "O(n log n)",
+        "space": "O(n)",
+        "description": "Divides array into halves, sorts them, and merges them back together."
+    },
+    "quick": {
+        "name": "Quicksort",
+        "time_best": "O(n log n)",
+        "time_avg": "O(n log n)",
+        "time_worst": "O(n²)",
+        "space": "O(log n)",
+        "description": "Selects a pivot element and partitions array around it, recursively sorting partitions."
+    },
+    "quickselect": {
+        "name": "Quickselect",
+        "time_best": "O(n)",
+        "time_avg": "O(n)",
+        "time_worst": "O(n²)",
+        "space": "O(1)",
+        "description": "Finds the k-th smallest value (the median by default) by partitioning only the side that holds it."
+    },
+    "topk": {
+        "name": "Top-k (bounded heap)",
+        "time_best": "O(n)",
+        "time_avg": "O(n log k)",
+        "time_worst": "O(n log k)",
+        "space": "O(1)",
+        "description": "Streams over the array keeping the k largest values seen so far in a min-heap of size k."
+    }
+}
+
+
+SORT_FUNCTIONS = {
+    "bubble": bubble_sort,
+    "selection": selection_sort,
+    "insertion": insertion_sort,
+    "merge": merge_sort,
+    "quick": quicksort,
+    "quickselect": quickselect,
+    "topk": top_k,
+}
+
+# these take k and only partly order the array; see select_answer
+SELECT_ALGORITHMS = {"quickselect", "topk"}
+
+MAX_API_TRACE_ITEMS = 200
+MAX_API_SELECT_ITEMS = 100_000
+
+
+def trace_sort(algorithm, arr, k=None):
+    """Worker-side entry: run a tracing sort by name."""
+    if algorithm in SELECT_ALGORITHMS:
+        return SORT_FUNCTIONS[algorithm](arr, k)
+    return SORT_FUNCTIONS[algorithm](arr)
+
+
+def parse_select_k(algorithm, raw, n):
+    """k for a selection algorithm; blank means the median for quickselect and 3 for top-k."""
+    if raw is None or raw == "":
+        return (n + 1) // 2 if algorithm == "quickselect" else min(3, n)
+    return _check_k(int(raw), n)
+
+
+def select_answer(algorithm, arr, k):
+    """The value(s) a selection trace was after, read from its output array."""
+    return arr[k - 1] if algorithm == "quickselect" else arr[:k]
+
+
+def select_values(algorithm, values, k):
+    """Trace-free selection for large inputs."""
+    return select_kth(values, k) if algorithm == "quickselect" else top_k_fast(values, k)
+
+
+# ---------------------------
+# Sort result cache
+# ---------------------------
+# Classes submit the same example arrays over and over, so finished traces are
+# kept in an LRU keyed by (algorithm, input tuple, k) and bounded by bytes.
+# Decoding a trace back into per-step lists costs as much as recomputing it,
+# so an entry holds the trace already serialized to JSON (zlib-compressed):
+# a hit is spliced straight into the page or API response.
+SORT_CACHE_BYTES = int(os.environ.get("APP_SORT_CACHE_BYTES", str(8 * 1024 * 1024)))  # 0 disables
+SORT_CACHE_FILE = os.environ.get("APP_SORT_CACHE_FILE") or None
+SORT_CACHE_ENTRY_OVERHEAD = 200  # dict slot, key tuple and bookkeeping, roughly
+
+
+def steps_to_json(steps):
+    """Compact JSON for a trace. Steps hold only ints, so it is safe inside <script>."""
+    return json.dumps(steps, separators=(",", ":"), sort_keys=True)
+
+
+def _write_int(out, v):
+    # zigzag, so small negative values stay short
+    _write_varint(out, v << 1 if v >= 0 else (-v << 1) - 1)
+
+
+def _read_int(buf, pos):
+    z, pos = _read_varint(buf, pos)
+    return (z >> 1) if not z & 1 else -((z + 1) >> 1), pos
+
+
+class SortCache:
+    """Thread-safe LRU of serialized sort traces, bounded by total bytes."""
+
+    def __init__(self, max_bytes, path=None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # (algorithm, values, k) -> (sorted tuple, compressed steps JSON)
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def _cost(key, entry):
+        return len(entry[1]) + 8 * (len(key[1]) + len(entry[0])) + SORT_CACHE_ENTRY_OVERHEAD
+
+    def get(self, key):
+        """(sorted list, steps JSON) for key, or None."""
+        if not self.max_bytes:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return list(entry[0]), zlib.decompress(entry[1]).decode("ascii")
+
+    def put(self, key, sorted_arr, steps_json):
+        if self.max_bytes:
+            self._insert(key, (tuple(sorted_arr), zlib.compress(steps_json.encode("ascii"), 6)))
+
+    def _insert(self, key, entry):
+        cost = self._cost(key, entry)
+        if cost > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= self._cost(key, old)
+            self.entries[key] = entry
+            self.bytes += cost
+            while self.bytes > self.max_bytes:
+                old_key, old = self.entries.popitem(last=False)
+                self.bytes -= self._cost(old_key, old)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                    "persist_file": self.path}
+
+    def render_metrics(self):
+        """Prometheus lines for /metrics."""
+        st = self.stats()
+        out = []
+        for name, kind, help_text, value in (
+                ("app_sort_cache_hits_total", "counter", "Sort cache hits.", st["hits"]),
+                ("app_sort_cache_misses_total", "counter", "Sort cache misses.", st["misses"]),
+                ("app_sort_cache_evictions_total", "counter", "Sort cache evictions.", st["evictions"]),
+                ("app_sort_cache_entries", "gauge", "Traces held in the sort cache.", st["entries"]),
+                ("app_sort_cache_bytes", "gauge", "Bytes held in the sort cache.", st["bytes"])):
+            out += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(out) + "\n"
+
+    # Persistence uses the session codec's frame, one record per entry, oldest first:
+    #   varint count, then per entry: varint len + algorithm, varint k + 1 (0 = none),
+    #   varint n + n zigzag inputs, n zigzag sorted values, varint len + compressed steps JSON
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self.lock:
+            items = list(self.entries.items())
+        body = bytearray()
+        _write_varint(body, len(items))
+        for (algorithm, values, k), (sorted_arr, blob) in items:
+            name = algorithm.encode("utf-8")
+            _write_varint(body, len(name))
+            body += name
+            _write_varint(body, 0 if k is None else k + 1)
+            _write_varint(body, len(values))
+            for v in values + sorted_arr:
+                _write_int(body, v)
+            _write_varint(body, len(blob))
+            body += blob
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_frame(body, compress=False))  # the traces are compressed already
+        os.replace(tmp, path)
+
+    def load(self, path=None):
+        """Fill the cache from a saved file; a missing or unreadable file leaves it as it is."""
+        path = path or self.path
+        if not path or not self.max_bytes:
+            return 0
+        try:
+            with open(path, "rb") as f:
+                body = _unframe(f.read())
+            count, pos = _read_varint(body, 0)
+            loaded = []
+            for _ in range(count):
+                length, pos = _read_varint(body, pos)
+                algorithm = bytes(body[pos:pos + length]).decode("utf-8")
+                pos += length
+                k, pos = _read_varint(body, pos)
+                n, pos = _read_varint(body, pos)
+                values = []
+                for _ in range(2 * n):
+                    v, pos = _read_int(body, pos)
+                    values.append(v)
+                length, pos = _read_varint(body, pos)
+                if pos + length > len(body):
+                    raise ValueError("truncated entry")
+                key = (algorithm, tuple(values[:n]), k - 1 if k else None)
+                loaded.append((key, (tuple(values[n:]), bytes(body[pos:pos + length]))))
+                pos += length
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError, IndexError) as e:
+            app.logger.warning("ignoring unreadable sort cache file %s: %s", path, e)
+            return 0
+        for key, entry in loaded:
+            if key[0] in SORT_FUNCTIONS:
+                self._insert(key, entry)
+        return len(loaded)
+
+
+sort_cache = SortCache(SORT_CACHE_BYTES, SORT_CACHE_FILE)
+sort_cache.load()
+if SORT_CACHE_FILE:
+    atexit.register(sort_cache.save)
+
+
+def cached_trace_sort(algorithm, arr, k=None):
+    """(sorted, steps JSON) from the sort cache, or traced on the worker pool and then cached."""
+    key = (algorithm, tuple(arr), k)
+    hit = sort_cache.get(key)
+    if hit is not None:
+        return hit
+    sorted_arr, steps = worker_pool.run(trace_sort, algorithm, arr, k, cost=len(arr) ** 2)
+    steps_json = steps_to_json(steps)
+    sort_cache.put(key, sorted_arr, steps_json)
+    return sorted_arr, steps_json
+
+
+@app.route("/sorting/cache")
+def sort_cache_stats():
+    """Sort cache hit rate and memory use."""
+    return sort_cache.stats()
+
 
 @app.route("/sorting", methods=["GET", "POST"])
 def sorting():
     """Sorting algorithms demonstration page."""
     message = ""
     result = None
-    algorithm_info = {
-        "bubble": {
-            "name": "Bubble Sort",
-            "time_best": "O(n)",
-            "time_avg": "O(n²)",
-            "time_worst": "O(n²)",
-            "space": "O(1)",
-            "description": "Repeatedly compares adjacent elements and swaps them if they're in wrong order."
-        },
-        "selection": {
-            "name": "Selection Sort",
-            "time_best": "O(n²)",
-            "time_avg": "O(n²)",
-            "time_worst": "O(n²)",
-            "space": "O(1)",
-            "description": "Finds the minimum element and places it at the beginning, repeatedly."
-        },
-        "insertion": {
-            "name": "Insertion Sort",
-            "time_best": "O(n)",
-            "time_avg": "O(n²)",
-            "time_worst": "O(n²)",
-            "space": "O(1)",
-            "description": "Builds the sorted array one element at a time by inserting elements in their correct position."
-        },
-        "merge": {
-            "name": "Merge Sort",
-            "time_best": "O(n log n)",
-            "time_avg": "O(n log n)",
-            "time_worst": "O(n log n)",
-            "space": "O(n)",
-            "description": "Divides array into halves, sorts them, and merges them back together."
-        },
-        "quick": {
-            "name": "Quicksort",
-            "time_best": "O(n log n)",
-            "time_avg": "O(n log n)",
-            "time_worst": "O(n²)",
-            "space": "O(log n)",
-            "description": "Selects a pivot element and partitions array around it, recursively sorting partitions."
-        }
-    }
     
     if request.method == "POST":
         algorithm = request.form.get("algorithm")
@@ -1127,39 +4897,161 @@ def sorting():
                 else:
                     original = arr.copy()
                     
-                    if algorithm == "bubble":
-                        sorted_arr, steps = bubble_sort(arr)
-                    elif algorithm == "selection":
-                        sorted_arr, steps = selection_sort(arr)
-                    elif algorithm == "insertion":
-                        sorted_arr, steps = insertion_sort(arr)
-                    elif algorithm == "merge":
-                        sorted_arr, steps = merge_sort(arr)
-                    elif algorithm == "quick":
-                        sorted_arr, steps = quicksort(arr)
-                    else:
+                    if algorithm not in SORT_FUNCTIONS:
                         message = "Invalid algorithm selected."
                         return render_template("sorting.html", message=message, 
-                                             algorithms=algorithm_info, result=None)
+                                             algorithms=ALGORITHM_INFO, result=None)
+                    
+                    k = None
+                    if algorithm in SELECT_ALGORITHMS:
+                        try:
+                            k = parse_select_k(algorithm, request.form.get("k", "").strip(), len(arr))
+                        except ValueError:
+                            message = f"k must be a whole number between 1 and {len(arr)}."
+                            return render_template("sorting.html", message=message,
+                                                 algorithms=ALGORITHM_INFO, result=None)
+                    
+                    with span("sort"):
+                        sorted_arr, steps_json = cached_trace_sort(algorithm, arr, k)
                     
                     result = {
                         "original": original,
                         "sorted": sorted_arr,
-                        "steps": steps,
+                        "steps_json": Markup(steps_json),
                         "algorithm": algorithm,
-                        "info": algorithm_info[algorithm]
+                        "info": ALGORITHM_INFO[algorithm]
                     }
-                    message = f"Sorted using {algorithm_info[algorithm]['name']}!"
+                    if k is None:
+                        message = f"Sorted using {ALGORITHM_INFO[algorithm]['name']}!"
+                    else:
+                        result["k"] = k
+                        result["answer"] = answer = select_answer(algorithm, sorted_arr, k)
+                        if algorithm == "quickselect":
+                            result["answer_text"] = f"The k-th smallest value (k = {k}) is {answer}."
+                        else:
+                            result["answer_text"] = f"The {k} largest values: {', '.join(map(str, answer))}."
+                        message = f"Selected using {ALGORITHM_INFO[algorithm]['name']}!"
                     
             except ValueError:
                 message = "Please enter valid integers only."
     
     return render_template("sorting.html", message=message, 
-                         algorithms=algorithm_info, result=result)
+                         algorithms=ALGORITHM_INFO, result=result)
+
+
+def _sort_api_request():
+    data = request.get_json(silent=True) or {}
+    algorithm = data.get("algorithm")
+    values = data.get("values")
+    trace = data.get("trace", True)
+    if algorithm not in SORT_FUNCTIONS:
+        return None, ({"error": "Invalid algorithm selected."}, 400)
+    if trace is not True and (trace is not False or algorithm not in SELECT_ALGORITHMS):
+        return None, ({"error": "trace may only be false for quickselect and topk."}, 400)
+    limit = MAX_API_TRACE_ITEMS if trace else MAX_API_SELECT_ITEMS
+    if (not isinstance(values, list) or not 0 < len(values) <= limit
+            or not all(type(v) is int for v in values)):
+        return None, ({"error": f"values must be 1-{limit} integers."}, 400)
+    k = None
+    if algorithm in SELECT_ALGORITHMS:
+        raw = data.get("k")
+        if raw is not None and type(raw) is not int:
+            return None, ({"error": "k must be an integer."}, 400)
+        try:
+            k = parse_select_k(algorithm, raw, len(values))
+        except ValueError as e:
+            return None, ({"error": str(e)}, 400)
+    return (algorithm, values, k, trace), None
+
+
+def _sort_api_response(algorithm, values, k, sorted_arr, steps_json):
+    body = {"algorithm": algorithm, "original": values, "sorted": sorted_arr}
+    if k is not None:
+        body["k"] = k
+        body["result"] = select_answer(algorithm, sorted_arr, k)
+    # splice the (possibly cached) trace in rather than re-encoding every step; "steps" sorts last
+    head = json.dumps(body, separators=(",", ":"), sort_keys=True)
+    return Response(f'{head[:-1]},"steps":{steps_json}}}', mimetype="application/json")
+
+
+def _select_api_response(algorithm, values, k):
+    # expected O(n) / O(n log k): cheaper to run here than to ship the values to a worker
+    return {"algorithm": algorithm, "k": k, "result": select_values(algorithm, values, k)}
+
+
+@app.route("/api/sort", methods=["POST"])
+def api_sort():
+    """JSON sort trace: {"algorithm": "quick", "values": [3, 1, 2]}.
+
+    quickselect and topk also take "k", and "trace": false for large inputs.
+    Traces are capped at MAX_TRACE_CELLS (steps x values); longer ones are a 400.
+    """
+    parsed, error = _sort_api_request()
+    if error:
+        return error
+    algorithm, values, k, trace = parsed
+    if not trace:
+        return _select_api_response(algorithm, values, k)
+    try:
+        sorted_arr, steps_json = cached_trace_sort(algorithm, values, k)
+    except TraceTooLarge as e:
+        return {"error": str(e)}, 400
+    return _sort_api_response(algorithm, values, k, sorted_arr, steps_json)
+
+
+def _external_job_response(job, status=200):
+    body = job.status()
+    body["status_url"] = url_for("external_sort_status", job_id=job.id)
+    if job.phase == "done":
+        body["download_url"] = url_for("external_sort_download", job_id=job.id)
+    return body, status
+
+
+@app.route("/sorting/external", methods=["POST"])
+def external_sort():
+    """Upload a file of integers to sort on disk; poll the returned status_url."""
+    request.max_content_length = EXTERNAL_MAX_UPLOAD_BYTES
+    try:
+        upload = request.files.get("file")
+    except RequestEntityTooLarge:
+        return {"error": f"Uploads are limited to {EXTERNAL_MAX_UPLOAD_BYTES} bytes."}, 413
+    if upload is None or not upload.filename:
+        return {"error": "Choose a file of whitespace or comma separated integers."}, 400
+    try:
+        job = start_external_sort(upload)
+    except ExternalSortBusy as e:
+        return {"error": str(e)}, 503, {"Retry-After": "30"}
+    return _external_job_response(job, 202)
+
+
+@app.route("/sorting/external/<job_id>")
+def external_sort_status(job_id):
+    job = get_external_job(job_id)
+    if job is None:
+        return {"error": "Unknown or expired job."}, 404
+    return _external_job_response(job)
+
+
+@app.route("/sorting/external/<job_id>/download")
+def external_sort_download(job_id):
+    job = get_external_job(job_id)
+    if job is None:
+        return {"error": "Unknown or expired job."}, 404
+    if job.phase != "done":
+        return _external_job_response(job, 409)
+    name = os.path.splitext(os.path.basename(job.filename))[0] or "upload"
+    return send_file(job.output_path, mimetype="text/plain", as_attachment=True,
+                     download_name=f"{name}-sorted.txt")
+
+
+# ASGI application for async servers, e.g. `uvicorn app:asgi_app` (see serve.py).
+# WsgiToAsgi runs each request on a thread, so views stay synchronous.
+asgi_app = WsgiToAsgi(app) if WsgiToAsgi is not None else None
 
 
 # ---------------------------
 # Run server
 # ---------------------------
 if __name__ == "__main__":
-    app.run(debug=True)
+    # development server only; use serve.py in production
+    app.run(debug=os.environ.get("FLASK_DEBUG", "1") == "1")
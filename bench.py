@@ -0,0 +1,222 @@
+"""Micro-benchmarks for the data structures and algorithms in app.py.
+
+Run with:  python bench.py [name ...]
+With no arguments every benchmark is run.
+"""
+import bisect
+import heapq
+import os
+import random
+import sys
+import time
+
+import app
+
+
+def _timeit(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_merge_sort(n=1_000_000):
+    """Serial vs parallel merge sort; speedup is reported per core count."""
+    data = [random.randint(-10**9, 10**9) for _ in range(n)]
+    expected = sorted(data)
+    assert app.merge_sort_fast(data) == expected
+
+    base = _timeit(app.merge_sort_fast, data)
+    print(f"merge_sort_fast          n={n:<9} {base:8.3f}s")
+    cores = os.cpu_count() or 1
+    workers = 2
+    while workers <= cores:
+        pool = app.WorkerPool(workers, app.WORKER_TIMEOUT, workers)
+        try:
+            assert app.parallel_merge_sort(data, pool=pool) == expected  # also starts the processes
+            t = _timeit(app.parallel_merge_sort, data, workers, pool)
+        finally:
+            pool.shutdown()
+        print(f"parallel_merge_sort x{workers:<3} n={n:<9} {t:8.3f}s  speedup {base / t:5.2f}x")
+        workers *= 2
+
+
+def _nested(node):
+    """The pre-codec session format, for comparison."""
+    if node is None:
+        return None
+    return {"value": node.value, "left": _nested(node.left), "right": _nested(node.right)}
+
+
+def bench_codec(sizes=(10, 30, 100, 1000)):
+    """Signed session cookie size and encode/decode speed: nested JSON vs compact codec."""
+    signer = app.app.session_interface.get_signing_serializer(app.app)
+    for n in sizes:
+        tree = app.BinaryTree()
+        for v in random.sample(range(10 * n), n):
+            tree.bst_insert(str(v))
+        legacy = _nested(tree.root)
+        compact = app.serialize(tree.root)
+
+        legacy_cookie = len(signer.dumps({"tree_data": legacy}))
+        compact_cookie = len(signer.dumps({"tree_data": compact}))
+        t_legacy = _timeit(lambda: signer.loads(signer.dumps({"tree_data": _nested(tree.root)})))
+        t_compact = _timeit(lambda: app.deserialize(signer.loads(
+            signer.dumps({"tree_data": app.serialize(tree.root)}))["tree_data"]))
+        print(f"n={n:<5} cookie nested={legacy_cookie:>7}B compact={compact_cookie:>6}B "
+              f"({legacy_cookie / compact_cookie:4.1f}x)  round-trip nested={t_legacy * 1e3:7.2f}ms "
+              f"compact={t_compact * 1e3:7.2f}ms")
+
+
+def bench_pq(n=200_000, updates=100_000):
+    """IndexedHeap vs heapq vs a bisect-maintained sorted list."""
+    priorities = [random.random() for _ in range(n)]
+
+    def indexed_push_pop():
+        heap = app.IndexedHeap()
+        for i, p in enumerate(priorities):
+            heap.push(i, p)
+        while heap:
+            heap.pop()
+
+    def heapq_push_pop():
+        heap = []
+        for i, p in enumerate(priorities):
+            heapq.heappush(heap, (p, i))
+        while heap:
+            heapq.heappop(heap)
+
+    def sorted_push_pop():
+        items = []
+        for i, p in enumerate(priorities):
+            bisect.insort(items, (-p, i))  # descending, so pop() takes the minimum
+        while items:
+            items.pop()
+
+    def indexed_heapify():
+        app.IndexedHeap.heapify(enumerate(priorities))
+
+    def heapq_heapify():
+        heapq.heapify([(p, i) for i, p in enumerate(priorities)])
+
+    rng = random.Random(1)
+    changes = [(rng.randrange(n), rng.random()) for _ in range(updates)]
+
+    def indexed_update():
+        heap = app.IndexedHeap.heapify((i, p) for i, p in enumerate(priorities))
+        for i, p in changes:
+            heap.update(i + 1, p)
+        while heap:
+            heap.pop()
+
+    def heapq_update():
+        # no handles: lazy invalidation, stale entries are skipped on pop
+        heap = [(p, i) for i, p in enumerate(priorities)]
+        heapq.heapify(heap)
+        current = list(priorities)
+        for i, p in changes:
+            current[i] = p
+            heapq.heappush(heap, (p, i))
+        while heap:
+            p, i = heapq.heappop(heap)
+            if current[i] != p:
+                continue
+
+    def sorted_update():
+        current = list(priorities)
+        items = sorted((p, i) for i, p in enumerate(priorities))
+        for i, p in changes:
+            del items[bisect.bisect_left(items, (current[i], i))]
+            bisect.insort(items, (p, i))
+            current[i] = p
+        for _ in items:
+            pass
+
+    for label, fn in [("push+pop  IndexedHeap", indexed_push_pop), ("push+pop  heapq", heapq_push_pop),
+                      ("push+pop  sorted list", sorted_push_pop),
+                      ("heapify   IndexedHeap", indexed_heapify), ("heapify   heapq", heapq_heapify),
+                      ("update+drain IndexedHeap", indexed_update), ("update+drain heapq lazy", heapq_update),
+                      ("update+drain sorted", sorted_update)]:
+        print(f"{label:<28} n={n:<8} {_timeit(fn, repeat=1):8.3f}s")
+
+
+def bench_bfs(n_nodes=20_000, sources=256):
+    """All-pairs hops on the MRT graph, then batched multi-source BFS on a synthetic network."""
+    graph = app.MRTGraph()
+    names = graph.sorted_stations
+
+    def per_pair():
+        for a in names:
+            for b in names:
+                graph.bfs_shortest_path(a, b)
+
+    def matrix():
+        app.MRTGraph().distance_matrix()  # includes compiling the arrays
+
+    print(f"MRT all-pairs  per-pair BFS   {_timeit(per_pair):8.4f}s")
+    print(f"MRT all-pairs  distance_matrix {_timeit(matrix):7.4f}s")
+
+    # a ring of stations plus two random express links each: small diameter, wide levels
+    rng = random.Random(1)
+    stations = {str(i): [str((i - 1) % n_nodes), str((i + 1) % n_nodes),
+                         str(rng.randrange(n_nodes)), str(rng.randrange(n_nodes))] for i in range(n_nodes)}
+    big = app.MRTGraph(stations)
+    big.compiled
+    picked = random.sample(big.sorted_stations, sources)
+    t_vec = _timeit(big.hop_distances, picked, repeat=1)
+    numpy_module, app.np = app.np, None
+    try:
+        slow = app.MRTGraph(stations)
+        t_py = _timeit(slow.hop_distances, picked, repeat=1)
+    finally:
+        app.np = numpy_module
+    print(f"synthetic n={n_nodes} sources={sources}  numpy {t_vec:7.3f}s  python {t_py:7.3f}s"
+          + ("" if numpy_module is not None else "  (numpy not installed: both are python)"))
+
+
+def bench_select(n=1_000_000, k=10, traced=20):
+    """Median and top-k without full sorting, vs sorting first; traced variants by step count."""
+    data = [random.randint(-10**9, 10**9) for _ in range(n)]
+    expected = sorted(data)
+    mid = (n + 1) // 2
+    assert app.select_kth(data, mid) == expected[mid - 1]
+    assert app.top_k_fast(data, k) == expected[::-1][:k]
+
+    rows = [
+        ("median  select_kth", app.select_kth, data, mid),
+        ("median  merge_sort_fast", lambda d, i: app.merge_sort_fast(d)[i - 1], data, mid),
+        ("median  sorted()", lambda d, i: sorted(d)[i - 1], data, mid),
+        (f"top-{k}  top_k_fast", app.top_k_fast, data, k),
+        (f"top-{k}  merge_sort_fast", lambda d, m: app.merge_sort_fast(d)[:-m - 1:-1], data, k),
+        (f"top-{k}  sorted()", lambda d, m: sorted(d, reverse=True)[:m], data, k),
+    ]
+    for label, fn, *args in rows:
+        print(f"{label:<28} n={n:<9} {_timeit(fn, *args):8.3f}s")
+
+    small = [random.randint(0, 99) for _ in range(traced)]
+    counts = {
+        "quicksort": len(app.quicksort(small)[1]),
+        "quickselect (median)": len(app.quickselect(small, (traced + 1) // 2)[1]),
+        "merge_sort": len(app.merge_sort(small)[1]),
+        "top_k (k=3)": len(app.top_k(small, 3)[1]),
+    }
+    for label, steps in counts.items():
+        print(f"traced {label:<21} n={traced:<9} {steps:8d} steps")
+
+
+BENCHMARKS = {
+    "merge_sort": bench_merge_sort,
+    "codec": bench_codec,
+    "pq": bench_pq,
+    "bfs": bench_bfs,
+    "select": bench_select,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name}")
+        BENCHMARKS[name]()
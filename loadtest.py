@@ -0,0 +1,369 @@
+"""Load generator for the app's routes.
+
+    python loadtest.py                            # in-process via Flask's test client
+    python loadtest.py --mix tree -c 8 -n 5000    # 8 concurrent users, tree-heavy traffic
+    python loadtest.py --mix "bst_insert=5,bst_view=1"
+    python loadtest.py --server --server-workers 4   # start serve.py on a free local port
+    python loadtest.py --url http://127.0.0.1:8000   # an already running local server
+
+Each concurrent user keeps one session (cookie jar) for --session-length
+requests before starting a fresh one, so session/cookie growth from
+queue, deque and tree state shows up as it would for real visitors.
+Reports throughput, p50/p95/p99 latency and response/cookie sizes per route;
+run once with and once without --compress to compare bytes on the wire.
+Nothing leaves the machine: HTTP mode only talks to localhost and ignores proxies.
+"""
+import argparse
+import http.cookiejar
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+STATIONS = [
+    "North Avenue", "Araneta Center-Cubao", "Ortigas", "Boni", "Ayala", "Taft Avenue",
+    "Recto", "v Mapa", "Gilmore", "Katipunan", "Monumento", "Doroteo Jose", "EDSA", "Baclaran",
+]
+SORT_ALGORITHMS = ["bubble", "selection", "insertion", "merge", "quick"]
+
+
+# ---------------------------
+# Actions: (rng, user) -> (label, method, path, form data)
+# ---------------------------
+# `user` is per-session scratch state, e.g. values already inserted, so
+# searches and deletes hit existing keys about as often as real users do.
+def _value(rng):
+    return str(rng.randint(0, 9999))
+
+
+def _known(rng, user, key):
+    values = user.get(key)
+    return rng.choice(values) if values and rng.random() < 0.8 else _value(rng)
+
+
+def queue_view(rng, user):
+    return "GET /queue", "GET", "/queue", None
+
+
+def queue_add(rng, user):
+    return "POST /queue add", "POST", "/queue", {"action": "add", "item": _value(rng)}
+
+
+def queue_remove(rng, user):
+    return "POST /queue remove", "POST", "/queue", {"action": "remove"}
+
+
+def deque_add(rng, user):
+    action = rng.choice(["add_front", "add_rear"])
+    return f"POST /deque {action}", "POST", "/deque", {"action": action, "item": _value(rng)}
+
+
+def deque_remove(rng, user):
+    action = rng.choice(["remove_front", "remove_rear"])
+    return f"POST /deque {action}", "POST", "/deque", {"action": action}
+
+
+def pq_push(rng, user):
+    return ("POST /pq push", "POST", "/pq",
+            {"action": "push", "item": _value(rng), "priority": str(rng.randint(0, 99))})
+
+
+def pq_pop(rng, user):
+    return "POST /pq pop", "POST", "/pq", {"action": "pop"}
+
+
+def tree_view(rng, user):
+    return "GET /tree", "GET", "/tree", None
+
+
+def tree_insert(rng, user):
+    values = user.setdefault("tree", [])
+    parent = rng.choice(values) if values else _value(rng)
+    value = _value(rng)
+    if not values:
+        values.append(parent)
+    values.append(value)
+    return ("POST /tree/insert", "POST", "/tree/insert",
+            {"parent": parent, "value": value, "side": rng.choice(["left", "right"])})
+
+
+def tree_search(rng, user):
+    return "POST /tree/search", "POST", "/tree/search", {"search_key": _known(rng, user, "tree")}
+
+
+def tree_undo(rng, user):
+    return "POST /tree/undo", "POST", "/tree/undo", {"page": rng.choice(["tree", "bst"])}
+
+
+def bst_view(rng, user):
+    return "GET /bst", "GET", "/bst", None
+
+
+def bst_insert(rng, user):
+    value = _value(rng)
+    user.setdefault("bst", []).append(value)
+    return "POST /bst/insert", "POST", "/bst/insert", {"value": value}
+
+
+def bst_search(rng, user):
+    return "POST /bst/search", "POST", "/bst/search", {"search_key": _known(rng, user, "bst")}
+
+
+def bst_delete(rng, user):
+    key = _known(rng, user, "bst")
+    if key in user.get("bst", []):
+        user["bst"].remove(key)
+    return "POST /bst/delete", "POST", "/bst/delete", {"delete_key": key}
+
+
+def bst_kth(rng, user):
+    k = rng.choice(["1", "median", str(rng.randint(1, max(1, len(user.get("bst", [])))))])
+    return "POST /bst/kth", "POST", "/bst/kth", {"k": k}
+
+
+def bst_range(rng, user):
+    lo, hi = sorted((_value(rng), _value(rng)))
+    return "POST /bst/range", "POST", "/bst/range", {"lo": lo, "hi": hi}
+
+
+def graph_view(rng, user):
+    return "GET /graph", "GET", "/graph", None
+
+
+def graph_path(rng, user):
+    start, end = rng.sample(STATIONS, 2)
+    return "POST /graph", "POST", "/graph", {"start_station": start, "end_station": end}
+
+
+def sorting(rng, user):
+    # /sorting rejects more than 20 numbers, so stay within the cap to time real sorts
+    values = " ".join(str(rng.randint(-99, 99)) for _ in range(rng.randint(5, 20)))
+    return ("POST /sorting", "POST", "/sorting",
+            {"algorithm": rng.choice(SORT_ALGORITHMS), "array_input": values})
+
+
+ACTIONS = {fn.__name__: fn for fn in (
+    queue_view, queue_add, queue_remove, deque_add, deque_remove, pq_push, pq_pop,
+    tree_view, tree_insert, tree_search, tree_undo,
+    bst_view, bst_insert, bst_search, bst_delete, bst_kth, bst_range,
+    graph_view, graph_path, sorting,
+)}
+
+MIXES = {
+    "mixed": {"queue_view": 2, "queue_add": 3, "queue_remove": 1, "deque_add": 2, "deque_remove": 1,
+              "pq_push": 2, "pq_pop": 1,
+              "tree_view": 3, "tree_insert": 3, "tree_search": 2, "tree_undo": 1,
+              "bst_view": 3, "bst_insert": 4, "bst_search": 3, "bst_delete": 1, "bst_kth": 1, "bst_range": 1,
+              "graph_view": 1, "graph_path": 4, "sorting": 3},
+    "browse": {"queue_view": 1, "tree_view": 3, "bst_view": 3, "graph_view": 2, "graph_path": 2,
+               "tree_search": 1, "bst_search": 1},
+    "tree": {"tree_view": 2, "tree_insert": 4, "tree_search": 2, "tree_undo": 1,
+             "bst_view": 2, "bst_insert": 6, "bst_search": 4, "bst_delete": 2, "bst_kth": 1, "bst_range": 1},
+    "queues": {"queue_view": 1, "queue_add": 4, "queue_remove": 2, "deque_add": 4, "deque_remove": 2,
+               "pq_push": 4, "pq_pop": 2},
+    "graph": {"graph_view": 1, "graph_path": 9},
+    "sorting": {"sorting": 1},
+}
+
+
+def parse_mix(spec):
+    """A MIXES name or "action=weight,action=weight"."""
+    if spec in MIXES:
+        mix = MIXES[spec]
+    else:
+        mix = {}
+        for part in spec.split(","):
+            name, _, weight = part.partition("=")
+            mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(ACTIONS)
+    if unknown:
+        raise SystemExit(f"unknown actions {sorted(unknown)}; choose from {sorted(ACTIONS)}")
+    return [ACTIONS[name] for name in mix], list(mix.values())
+
+
+# ---------------------------
+# Clients (one per simulated session)
+# ---------------------------
+class InProcessClient:
+    def __init__(self, flask_app, headers=None):
+        self.client = flask_app.test_client()
+        self.headers = headers or {}
+
+    def request(self, method, path, data):
+        response = self.client.open(path, method=method, data=data, headers=self.headers)
+        cookie = self.client.get_cookie("session")
+        return response.status_code, len(response.get_data()), len(cookie.value) if cookie else 0
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    def __init__(self, base_url, headers=None):
+        self.base_url = base_url.rstrip("/")
+        self.headers = headers or {}
+        self.jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}), urllib.request.HTTPCookieProcessor(self.jar), _NoRedirect)
+
+    def request(self, method, path, data):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=self.headers)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                status, size = response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            status, size = e.code, len(e.read())
+        cookie = sum(len(c.value) for c in self.jar if c.name == "session")
+        return status, size, cookie
+
+
+def start_server(threads, workers):
+    """Run serve.py on a free localhost port; returns (process, base_url)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(here, "serve.py"), "--port", str(port),
+         "--threads", str(threads), "--workers", str(workers)],
+        cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("serve.py exited during startup")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit("serve.py did not start listening within 30s")
+
+
+# ---------------------------
+# Runner and report
+# ---------------------------
+def run_load(make_client, actions, weights, total, concurrency, session_length, seed):
+    """Issue `total` requests from `concurrency` users; returns (samples, elapsed seconds)."""
+    remaining = [total]
+    lock = threading.Lock()
+    samples = []
+
+    def take():
+        with lock:
+            remaining[0] -= 1
+            return remaining[0] >= 0
+
+    def user_loop(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        local = []
+        client, user, used = None, None, 0
+        while take():
+            if client is None or used >= session_length:
+                client, user, used = make_client(), {}, 0
+            label, method, path, data = rng.choices(actions, weights)[0](rng, user)
+            t0 = time.perf_counter()
+            try:
+                status, size, cookie = client.request(method, path, data)
+            except OSError:
+                status, size, cookie = 0, 0, 0
+            local.append((label, time.perf_counter() - t0, status, size, cookie))
+            used += 1
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=user_loop, args=(i,)) for i in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - t0
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def report(samples, elapsed, out=sys.stdout):
+    by_route = {}
+    for sample in samples:
+        by_route.setdefault(sample[0], []).append(sample)
+    by_route["TOTAL"] = samples
+
+    header = (f"{'route':<26}{'reqs':>7}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'resp B':>9}{'cookie B':>10}{'max cookie':>12}")
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    for label in sorted(by_route, key=lambda k: (k == "TOTAL", k)):
+        rows = by_route[label]
+        latencies = sorted(r[1] * 1000 for r in rows)
+        errors = sum(1 for r in rows if r[2] == 0 or r[2] >= 400)
+        print(f"{label:<26}{len(rows):>7}{errors:>6}{len(rows) / elapsed:>9.1f}"
+              f"{percentile(latencies, 50):>9.2f}{percentile(latencies, 95):>9.2f}{percentile(latencies, 99):>9.2f}"
+              f"{sum(r[3] for r in rows) / len(rows):>9.0f}{sum(r[4] for r in rows) / len(rows):>10.0f}"
+              f"{max(r[4] for r in rows):>12}", file=out)
+    print(f"\n{len(samples)} requests in {elapsed:.2f}s = {len(samples) / elapsed:.1f} req/s", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the app's routes and report latency percentiles.")
+    parser.add_argument("--mix", default="mixed",
+                        help=f"traffic mix: one of {', '.join(MIXES)} or 'action=weight,...'")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="total requests")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="concurrent simulated users")
+    parser.add_argument("--session-length", type=int, default=100,
+                        help="requests per session before a user starts a fresh cookie jar")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compress", action="store_true",
+                        help="send Accept-Encoding: br, gzip (resp B is then the encoded size)")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--server", action="store_true", help="start serve.py locally and use HTTP")
+    target.add_argument("--url", help="base URL of an already running local server")
+    parser.add_argument("--server-threads", type=int, default=8, help="WSGI threads for --server")
+    parser.add_argument("--server-workers", type=int, default=0, help="worker processes for --server")
+    args = parser.parse_args()
+
+    actions, weights = parse_mix(args.mix)
+    headers = {"Accept-Encoding": "br, gzip"} if args.compress else {"Accept-Encoding": "identity"}
+    proc = None
+    try:
+        if args.server:
+            proc, base_url = start_server(args.server_threads, args.server_workers)
+        else:
+            base_url = args.url
+        if base_url:
+            if urllib.parse.urlsplit(base_url).hostname not in ("127.0.0.1", "localhost", "::1"):
+                raise SystemExit("--url must point at a local server")
+            make_client = lambda: HTTPClient(base_url, headers)
+            where = base_url
+        else:
+            import app
+            make_client = lambda: InProcessClient(app.app, headers)
+            where = "in-process"
+        print(f"mix={args.mix} requests={args.requests} concurrency={args.concurrency} "
+              f"session_length={args.session_length} compress={args.compress} target={where}\n")
+        samples, elapsed = run_load(make_client, actions, weights, args.requests,
+                                    args.concurrency, args.session_length, args.seed)
+        report(samples, elapsed)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
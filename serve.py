@@ -0,0 +1,56 @@
+"""Production entry point (replaces the debug server in app.py).
+
+    python serve.py                      # threaded WSGI (waitress if installed)
+    python serve.py --asgi               # ASGI via uvicorn + asgiref (flask[async])
+    python serve.py --workers 4          # offload sorting/SVG/batch BFS to 4 processes
+    python serve.py --sort-cache cache.bin   # keep cached sort traces across restarts
+
+Worker pool options map onto the APP_WORKERS, APP_WORKER_TIMEOUT and
+APP_WORKER_MAX_PENDING environment variables read by app.py, and
+--sort-cache onto APP_SORT_CACHE_FILE.
+"""
+import argparse
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the DSA app.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--threads", type=int, default=8, help="WSGI request threads")
+    parser.add_argument("--asgi", action="store_true", help="serve app.asgi_app with uvicorn")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for CPU-heavy work (0 runs it inline)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds per offloaded task")
+    parser.add_argument("--max-pending", type=int, default=32, help="offloaded tasks queued before 503")
+    parser.add_argument("--sort-cache", metavar="FILE", help="load/save the sort trace cache here")
+    args = parser.parse_args()
+
+    # app.py reads these at import time
+    os.environ["APP_WORKERS"] = str(args.workers)
+    os.environ["APP_WORKER_TIMEOUT"] = str(args.timeout)
+    os.environ["APP_WORKER_MAX_PENDING"] = str(args.max_pending)
+    if args.sort_cache:
+        os.environ["APP_SORT_CACHE_FILE"] = args.sort_cache
+    import app as application
+
+    try:
+        if args.asgi:
+            if application.asgi_app is None:
+                raise SystemExit("--asgi needs asgiref: pip install 'flask[async]' uvicorn")
+            import uvicorn
+            uvicorn.run(application.asgi_app, host=args.host, port=args.port)
+        else:
+            try:
+                from waitress import serve
+            except ImportError:
+                from werkzeug.serving import run_simple
+                run_simple(args.host, args.port, application.app, threaded=True)
+            else:
+                serve(application.app, host=args.host, port=args.port, threads=args.threads)
+    finally:
+        application.worker_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# keep server-side tree blobs out of the source tree; must be set before app is imported
+os.environ.setdefault("APP_TREE_BLOB_DIR", tempfile.mkdtemp(prefix="tree_blobs_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    app_module.app.config["TESTING"] = True
+    return app_module.app.test_client()
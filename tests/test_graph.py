@@ -0,0 +1,44 @@
+import pytest
+
+import app as app_module
+
+TOKEN = "test-admin-token"
+
+
+@pytest.fixture
+def admin(client, monkeypatch):
+    monkeypatch.setenv("APP_ADMIN_TOKEN", TOKEN)
+
+    def post(payload):
+        return client.post("/graph/admin/edits", json=payload, headers={"X-Admin-Token": TOKEN})
+    return post
+
+
+@pytest.mark.parametrize("edit", [
+    {"op": "add_station", "name": 5},
+    {"op": "add_station", "name": "Depot", "neighbors": "Boni"},
+    {"op": "add_station", "name": "Depot", "neighbors": [5]},
+    {"op": "add_station", "name": "Depot", "neighbors": [["Boni"]]},
+    {"op": "add_station", "name": "Depot", "neighbors": ["Boni", "Boni"]},
+    {"op": "connect", "a": "Boni", "b": {"name": "Ortigas"}},
+    {"op": "close_segment", "a": None, "b": "Boni"},
+    {"op": "remove_station", "name": ["Boni"]},
+    {"op": ["close_station"], "name": "Boni"},
+])
+def test_malformed_edits_are_rejected_without_a_new_snapshot(admin, edit):
+    version = app_module.mrt_graph.version
+    response = admin({"edits": [edit]})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    assert app_module.mrt_graph.version == version
+
+
+@pytest.mark.parametrize("payload", [["not", "an", "object"], {"edits": "close Boni"}, {"edits": []}])
+def test_malformed_payloads_are_rejected(admin, payload):
+    assert admin(payload).status_code == 400
+
+
+def test_add_station_links_each_neighbor_once():
+    graph = app_module.mrt_graph.with_edits([{"op": "add_station", "name": "Depot", "neighbors": ["Boni", "Ortigas"]}])
+    assert graph.stations["Depot"] == ("Boni", "Ortigas")
+    assert graph.stations["Boni"].count("Depot") == 1
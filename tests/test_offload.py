@@ -0,0 +1,27 @@
+import app as app_module
+from test_trees import import_values
+
+
+class CountingPool(app_module.WorkerPool):
+    def __init__(self):
+        super().__init__(1, 30, 4)
+        self.submitted = []
+
+    def _submit(self, fn, args):
+        self.submitted.append(fn.__name__)
+        return super()._submit(fn, args)
+
+
+def test_tree_svg_is_rendered_on_the_worker_pool(client, monkeypatch):
+    pool = CountingPool()
+    monkeypatch.setattr(app_module, "worker_pool", pool)
+    try:
+        size = app_module.SVG_OFFLOAD_MIN_NODES + 50
+        assert size <= app_module.MAX_RENDER_NODES
+        import_values(client, "tree", [str(i) for i in range(size)])
+        response = client.get("/tree")
+    finally:
+        pool.shutdown()
+    assert response.status_code == 200
+    assert "svg_from_data" in pool.submitted
+    assert b'<svg class="bt"' in response.data
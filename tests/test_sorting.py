@@ -0,0 +1,62 @@
+import io
+import os
+import time
+
+import app as app_module
+
+
+def upload(client, data, name="numbers.txt"):
+    return client.post("/sorting/external", data={"file": (io.BytesIO(data), name)},
+                       content_type="multipart/form-data")
+
+
+def wait_for(client, job):
+    for _ in range(200):
+        status = client.get(f"/sorting/external/{job}").get_json()
+        if status["phase"] in ("done", "error"):
+            return status
+        time.sleep(0.05)
+    raise AssertionError("external sort did not finish")
+
+
+def test_external_sort_sorts_an_upload(client):
+    response = upload(client, b"5 3, -1\n4 +2")
+    assert response.status_code == 202
+    assert wait_for(client, response.get_json()["job"])["phase"] == "done"
+    download = client.get(response.get_json()["status_url"] + "/download")
+    assert download.get_data(as_text=True).split() == ["-1", "2", "3", "4", "5"]
+
+
+def test_external_sort_rejects_oversized_uploads(client, monkeypatch):
+    monkeypatch.setattr(app_module, "EXTERNAL_MAX_UPLOAD_BYTES", 1024)
+    response = upload(client, b"1 " * 1024)
+    assert response.status_code == 413
+    assert "error" in response.get_json()
+
+
+def test_external_sort_caps_pending_jobs(client, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_EXTERNAL_PENDING", 0)
+    response = upload(client, b"1 2 3")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_failed_external_sort_removes_its_directory(client):
+    response = upload(client, b"1 2 +-5")
+    status = wait_for(client, response.get_json()["job"])
+    assert status["phase"] == "error"
+    assert not os.path.exists(app_module.get_external_job(status["job"]).dir)
+
+
+def test_stale_job_directories_are_swept(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "EXTERNAL_SORT_DIR", str(tmp_path))
+    stale, fresh = tmp_path / "extsort-stale", tmp_path / "extsort-fresh"
+    for directory in (stale, fresh):
+        directory.mkdir()
+        (directory / "run-00000.bin").write_bytes(b"\0" * 8)
+    old = time.time() - app_module.EXTERNAL_JOB_TTL - 60
+    for path in (stale, stale / "run-00000.bin"):
+        os.utime(path, (old, old))
+    app_module._sweep_external_dirs(set(), time.time())
+    assert not stale.exists()
+    assert fresh.exists()
@@ -0,0 +1,62 @@
+import io
+import json
+import random
+import warnings
+
+import app as app_module
+
+BROWSER_COOKIE_LIMIT = 4093
+
+
+def import_values(client, page, values, fmt="values"):
+    upload = (io.BytesIO("\n".join(values).encode("utf-8")), "tree.txt")
+    return client.post("/tree/import", data={"page": page, "format": fmt, "file": upload},
+                       content_type="multipart/form-data")
+
+
+def test_inline_trees_share_one_cookie_budget(client):
+    rng = random.Random(0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # werkzeug warns when a cookie is too large
+        for page in ("tree", "bst"):
+            values = [str(rng.randint(0, 10**6)) for _ in range(340)]
+            response = import_values(client, page, values)
+            assert response.status_code == 302
+            for cookie in response.headers.getlist("Set-Cookie"):
+                assert len(cookie) < BROWSER_COOKIE_LIMIT
+    with client.session_transaction() as session:
+        stored = [session.get("tree_data"), session.get("tree_data:bst")]
+    assert sum(isinstance(s, dict) and "blob" in s for s in stored) == 1
+
+
+def export_level(client):
+    response = client.get("/tree/export?format=level&page=tree")
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def test_level_order_export_round_trips_awkward_values(client):
+    values = ["root", "null", "None", None, "#", 'a"b', "back\\slash", "a, b", "[x]", " padded "]
+    assert import_values(client, "tree", [json.dumps(values)], fmt="level").status_code == 302
+    first = export_level(client)
+    assert json.loads(first) == values
+
+    assert import_values(client, "tree", [first], fmt="level").status_code == 302
+    assert export_level(client) == first
+
+
+def test_level_order_import_reads_plain_lists(client):
+    import_values(client, "tree", ["[1, 2, null,", " #, 3]"], fmt="level")
+    assert json.loads(export_level(client)) == ["1", "2", None, None, "3"]
+
+
+def test_conditional_get_of_blob_tree_does_not_read_the_blob(client, monkeypatch):
+    import_values(client, "tree", [str(i) for i in range(2000)])
+    first = client.get("/tree")
+    etag = first.headers["ETag"]
+
+    def fail(ref):
+        raise AssertionError("blob read for a conditional GET")
+
+    monkeypatch.setattr(app_module.tree_blobs, "get", fail)
+    assert client.get("/tree", headers={"If-None-Match": etag}).status_code == 304